@@ -1,5 +1,6 @@
+import asyncio
+import functools
 import json
-import boto3
 import urllib.parse
 import logging
 from botocore.exceptions import ClientError
@@ -7,13 +8,33 @@ import os
 from datetime import datetime
 from decimal import Decimal
 import mimetypes
+import hashlib
+import re
+import time
+import threading
+from collections import OrderedDict
+from io import BytesIO
+from concurrent.futures import ThreadPoolExecutor
 from email.message import EmailMessage
+from boto3.dynamodb.conditions import Key
+from aws_clients import configure as configure_aws_clients, get_client, get_resource
+import metrics
+import governor
+import image_quality
+import image_variants
+from face_matchers import create_face_matcher, FULL_FRAME_BOX
 
-# Initialize AWS clients
-s3 = boto3.client('s3')
-rekognition = boto3.client('rekognition')
-dynamodb = boto3.resource('dynamodb')
-ses = boto3.client('ses', region_name='us-east-1')  # Replace with your SES region
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# AWS clients are created lazily on first use (see aws_clients.py)
+face_matcher = None  # Built on first use from FACE_MATCHER_BACKEND
+record_executor = None  # Reused across warm invocations so worker threads keep their clients
+lookup_executor = None  # Separate pool for owner lookups so record workers never wait on their own pool
+face_search_executor = None  # Separate pool for per-face searches of group photos
+async_executor = None  # Pool the asyncio engine bridges blocking AWS calls to
 
 # Initialize logging
 logger = logging.getLogger()
@@ -24,6 +45,90 @@ DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME", "") # Replace with y
 REKOGNITION_COLLECTION_ID = os.environ.get("REKOGNITION_COLLECTION_ID", "") # Replace with your Rekognition collection id
 SIMILARITY_THRESHOLD = float(os.environ.get("SIMILARITY_THRESHOLD", 80.0))  # Adjust as needed
 SES_SENDER_EMAIL = os.environ.get("SES_SENDER_EMAIL", "")  # Replace with your verified SES email
+SES_REGION = os.environ.get("SES_REGION", "us-east-1")  # Replace with your SES region
+
+# Number of SQS records processed in parallel per invocation (1 = sequential)
+PROCESSOR_MAX_WORKERS = int(os.environ.get("PROCESSOR_MAX_WORKERS", 4))
+
+# "threads" runs each record on the record pool; "asyncio" runs every record as a DAG of overlapping
+# stages on one event loop (see process_batch_async)
+PROCESSOR_ENGINE = os.environ.get("PROCESSOR_ENGINE", "threads").lower()
+ASYNC_MAX_CONCURRENCY = int(os.environ.get("ASYNC_MAX_CONCURRENCY", 16))  # Blocking AWS calls in flight across the batch
+
+# Owner notifications: "digest" sends one email per recipient per batch with linked images,
+# "attachment" sends one email per match with the image attached
+NOTIFICATION_MODE = os.environ.get("NOTIFICATION_MODE", "digest").lower()
+NOTIFICATION_LINK_EXPIRES_IN = int(os.environ.get("NOTIFICATION_LINK_EXPIRES_IN", 43200))  # Seconds the image link stays valid
+SES_TEMPLATE_NAME = os.environ.get("SES_TEMPLATE_NAME", "")  # Optional SES template for bulk templated sends
+SES_BULK_MAX_DESTINATIONS = 50  # SES SendBulkTemplatedEmail limit
+
+# Idempotency ledger for at-least-once SQS delivery (DynamoDB table with TTL on expires_at; disabled when unset)
+IDEMPOTENCY_TABLE = os.environ.get("IDEMPOTENCY_TABLE", "")
+IDEMPOTENCY_TTL_SECONDS = int(os.environ.get("IDEMPOTENCY_TTL_SECONDS", 86400))
+IDEMPOTENCY_LOCK_SECONDS = int(os.environ.get("IDEMPOTENCY_LOCK_SECONDS", 300))  # Keep at or below the queue visibility timeout
+
+# Owner lookup cache kept across warm invocations
+OWNER_CACHE_MAX_ENTRIES = int(os.environ.get("OWNER_CACHE_MAX_ENTRIES", 1024))
+OWNER_CACHE_TTL_SECONDS = int(os.environ.get("OWNER_CACHE_TTL_SECONDS", 300))
+OWNER_LOOKUP_MAX_WORKERS = int(os.environ.get("OWNER_LOOKUP_MAX_WORKERS", 5))
+
+# Group photos: detect faces once, crop them locally and search each face (needs Pillow)
+MULTI_FACE_SEARCH_ENABLED = os.environ.get("MULTI_FACE_SEARCH_ENABLED", "true").lower() == "true"
+MAX_FACES_PER_IMAGE = int(os.environ.get("MAX_FACES_PER_IMAGE", 10))  # Largest faces searched per photo
+FACE_SEARCH_MAX_WORKERS = int(os.environ.get("FACE_SEARCH_MAX_WORKERS", 4))  # Concurrent per-face searches
+FACE_CROP_MARGIN = float(os.environ.get("FACE_CROP_MARGIN", 0.25))  # Padding around each face, as a share of its box
+FACE_CROP_JPEG_QUALITY = 90
+
+# Match history (required): one item per match (partition key family_member_id, sort key match_id); the family item keeps a summary
+MATCH_HISTORY_TABLE = os.environ.get("MATCH_HISTORY_TABLE") or f"{DYNAMODB_TABLE_NAME}-match-history"
+MATCH_HISTORY_WRITE_ATTEMPTS = int(os.environ.get("MATCH_HISTORY_WRITE_ATTEMPTS", 3))  # Before unprocessed history items fail the record
+DYNAMODB_BATCH_WRITE_SIZE = 25  # BatchWriteItem limit
+
+# Size the shared HTTP connection pool for parallel record workers, owner lookups and face searches
+configure_aws_clients(
+    (ASYNC_MAX_CONCURRENCY if PROCESSOR_ENGINE == "asyncio" else PROCESSOR_MAX_WORKERS + OWNER_LOOKUP_MAX_WORKERS)
+    + FACE_SEARCH_MAX_WORKERS
+)
+
+# Face search result cache keyed by image SHA-256 (DynamoDB table with TTL on expires_at, or in-process when unset)
+FACE_SEARCH_CACHE_TABLE = os.environ.get("FACE_SEARCH_CACHE_TABLE", "")
+FACE_SEARCH_CACHE_TTL_SECONDS = int(os.environ.get("FACE_SEARCH_CACHE_TTL_SECONDS", 86400))
+# The in-process cache cannot see faces indexed by other containers, so it is off (0) unless given a short TTL
+FACE_SEARCH_LOCAL_CACHE_TTL_SECONDS = int(os.environ.get("FACE_SEARCH_LOCAL_CACHE_TTL_SECONDS", 0))
+FACE_SEARCH_LOCAL_CACHE_MAX_ENTRIES = int(os.environ.get("FACE_SEARCH_LOCAL_CACHE_MAX_ENTRIES", 256))
+REKOGNITION_COLLECTION_VERSION = os.environ.get("REKOGNITION_COLLECTION_VERSION", "1")  # Bump after rebuilding the collection
+COLLECTION_VERSION_ITEM_KEY = "__collection_version__"
+CONTENT_HASH_KEY_PATTERN = re.compile(r"-([0-9a-f]{64})(?:\.[a-z]+)?\.[A-Za-z0-9]+$")  # Also matches variant keys (<hash>.<variant>.jpg)
+
+# In-process LRU store used when FACE_SEARCH_CACHE_TABLE is not configured
+local_face_search_cache = OrderedDict()
+local_collection_revision = 0
+local_cache_lock = threading.Lock()
+
+# LRU cache of owner details keyed by (owner_id, family_member_id)
+owner_cache = OrderedDict()
+owner_cache_lock = threading.Lock()
+
+def get_dynamodb_resource():
+    """
+    Return the DynamoDB resource for the current thread.
+    """
+    return get_resource('dynamodb')
+
+def get_ses_client():
+    """
+    Return the SES client for SES_REGION. Its calls are retried by the ses governor, not botocore.
+    """
+    return get_client('ses', SES_REGION, max_attempts=1)
+
+def get_face_matcher():
+    """
+    Return the face matching backend selected by FACE_MATCHER_BACKEND (Rekognition by default).
+    """
+    global face_matcher
+    if face_matcher is None:
+        face_matcher = create_face_matcher(rekognition_client=get_client('rekognition', max_attempts=1), image_loader=get_image_from_s3)
+    return face_matcher
 
 def parse_s3_url(s3_url):
     """
@@ -39,14 +144,26 @@ def parse_s3_url(s3_url):
         logger.error(f"Error parsing S3 URL {s3_url}: {str(e)}")
         return None, None
 
+def get_variant_location(image_variants, variant, bucket, key):
+    """
+    Return the bucket and key of an image variant from the message, or the original image when it has none.
+    """
+    variant_bucket, variant_key = parse_s3_url(image_variants[variant]) if image_variants.get(variant) else (None, None)
+    if not variant_bucket or not variant_key:
+        return bucket, key
+    return variant_bucket, variant_key
+
 def get_image_from_s3(bucket, key):
     """
     Retrieve the image bytes from the specified S3 bucket and key.
     """
     try:
         logger.info(f"Retrieving image from S3. Bucket: {bucket}, Key: {key}")
-        response = s3.get_object(Bucket=bucket, Key=key)
-        return response['Body'].read()
+        with metrics.stage("s3_get") as timer:
+            response = get_client('s3').get_object(Bucket=bucket, Key=key)
+            image_bytes = response['Body'].read()
+            timer.size = len(image_bytes)
+        return image_bytes
     except ClientError as e:
         logger.error(f"S3 ClientError: {e.response['Error']['Message']}")
         return None
@@ -54,93 +171,569 @@ def get_image_from_s3(bucket, key):
         logger.error(f"Unexpected error retrieving image from S3: {str(e)}")
         return None
 
-def compare_faces(image_bytes, collection_id, similarity_threshold):
+class ImageUnavailableError(RuntimeError):
+    """
+    Raised when an image referenced by a record cannot be downloaded; the record is retried.
+    """
+
+class S3Image:
     """
-    Use Rekognition to compare faces in the image against the specified collection.
+    An image in S3 that is only downloaded when its bytes are needed.
+    Rekognition reads the object itself through reference, so records that need no crop
+    and no email attachment never fetch the image into the function.
+    """
+
+    def __init__(self, bucket, key):
+        self.bucket = bucket
+        self.key = key
+        self._data = None
+
+    @property
+    def reference(self):
+        return {'S3Object': {'Bucket': self.bucket, 'Name': self.key}}
+
+    @property
+    def data(self):
+        if self._data is None:
+            self._data = get_image_from_s3(self.bucket, self.key)
+            if not self._data:
+                # Fail the record so SQS redelivers it
+                raise ImageUnavailableError(f"Failed to retrieve image from S3: s3://{self.bucket}/{self.key}")
+        return self._data
+
+def get_image_size(image):
+    """
+    Byte count of a Rekognition Image for metrics (None for S3Object references).
+    """
+    return len(image['Bytes']) if 'Bytes' in image else None
+
+def search_face_matches(image, collection_id, similarity_threshold):
+    """
+    Search the collection for faces matching the image through the face matcher backend.
+    image is a Rekognition Image: {'Bytes': ...} or an S3Object reference.
+    Errors are raised to the caller.
     Returns a list of matches with similarity and family_member_id.
     """
-    try:
-        logger.info(f"Comparing faces against collection: {collection_id} with threshold: {similarity_threshold}")
-        response = rekognition.search_faces_by_image(
-            CollectionId=collection_id,
-            Image={'Bytes': image_bytes},
-            FaceMatchThreshold=similarity_threshold,
-            MaxFaces=5  # Adjust based on your needs
+    logger.info(f"Comparing faces against collection: {collection_id} with threshold: {similarity_threshold}")
+    with metrics.stage("rekognition_search", size=get_image_size(image)):
+        face_matches = get_face_matcher().search_faces(
+            collection_id,
+            image,
+            similarity_threshold,
+            max_faces=5  # Adjust based on your needs
         )
-        face_matches = response.get('FaceMatches', [])
-        matches = []
-        for match in face_matches:
-            similarity = match['Similarity']
-            external_image_id = match['Face'].get('ExternalImageId')  # Retrieve family_member_id
-            if external_image_id:
-                matches.append({
-                    'Similarity': Decimal(str(similarity)),  # Convert float to Decimal
-                    'family_member_id': external_image_id  # Include family_member_id for owner retrieval
-                })
-            else:
-                logger.warning("Match found without ExternalImageId.")
-        logger.info(f"Found {len(matches)} matching face(s).")
-        return matches
+    matches = []
+    for match in face_matches:
+        similarity = match['Similarity']
+        external_image_id = match['Face'].get('ExternalImageId')  # Retrieve family_member_id
+        if external_image_id:
+            matches.append({
+                'Similarity': Decimal(str(similarity)),  # Convert float to Decimal
+                'family_member_id': external_image_id  # Include family_member_id for owner retrieval
+            })
+        else:
+            logger.warning("Match found without ExternalImageId.")
+    logger.info(f"Found {len(matches)} matching face(s).")
+    return matches
+
+def detect_faces(image):
+    """
+    Locate the faces in the Rekognition Image with one detection call, largest first.
+    """
+    with metrics.stage("rekognition_detect", size=get_image_size(image)):
+        face_details = get_face_matcher().detect_faces(image)
+    face_details.sort(key=lambda face: face['BoundingBox']['Width'] * face['BoundingBox']['Height'], reverse=True)
+    logger.info(f"Detected {len(face_details)} face(s).")
+    return face_details
+
+def crop_faces(image_bytes, face_details):
+    """
+    Crop each detected face, with FACE_CROP_MARGIN padding, from the image already in memory.
+    The image is decoded once. Returns JPEG bytes per face.
+    """
+    with metrics.stage("crop_faces", size=len(image_bytes)):
+        image = Image.open(BytesIO(image_bytes))
+        image.load()
+        if image.mode != "RGB":
+            image = image.convert("RGB")
+        width, height = image.size
+        crops = []
+        for face in face_details:
+            box = face['BoundingBox']
+            margin_x = box['Width'] * FACE_CROP_MARGIN
+            margin_y = box['Height'] * FACE_CROP_MARGIN
+            left = max(0, int((box['Left'] - margin_x) * width))
+            top = max(0, int((box['Top'] - margin_y) * height))
+            right = min(width, int((box['Left'] + box['Width'] + margin_x) * width))
+            bottom = min(height, int((box['Top'] + box['Height'] + margin_y) * height))
+            output = BytesIO()
+            image.crop((left, top, right, bottom)).save(output, format="JPEG", quality=FACE_CROP_JPEG_QUALITY)
+            crops.append(output.getvalue())
+    return crops
+
+def get_face_search_executor():
+    """
+    Return the shared thread pool used for per-face searches.
+    """
+    global face_search_executor
+    if face_search_executor is None:
+        face_search_executor = ThreadPoolExecutor(max_workers=FACE_SEARCH_MAX_WORKERS)
+    return face_search_executor
+
+def search_face_crop(face_bytes, collection_id, similarity_threshold):
+    """
+    Search one cropped face. Crops Rekognition cannot use (e.g. too small) yield no matches.
+    """
+    try:
+        return search_face_matches({'Bytes': face_bytes}, collection_id, similarity_threshold)
     except ClientError as e:
-        logger.error(f"Rekognition ClientError (CompareFaces): {e.response['Error']['Message']}")
+        if e.response['Error']['Code'] != 'InvalidParameterException':
+            raise
+        logger.info("Skipping a detected face that could not be searched.")
         return []
+
+def merge_face_matches(match_lists):
+    """
+    Merge the matches of several faces, keeping the best similarity per family_member_id.
+    """
+    best = {}
+    for matches in match_lists:
+        for match in matches:
+            current = best.get(match['family_member_id'])
+            if current is None or match['Similarity'] > current['Similarity']:
+                best[match['family_member_id']] = match
+    return sorted(best.values(), key=lambda match: match['Similarity'], reverse=True)
+
+def search_all_faces(image, collection_id, similarity_threshold):
+    """
+    Search every face in the S3Image, not only the largest one.
+    Faces are detected once by S3 reference. Only photos with several faces are downloaded, cropped
+    locally and searched face by face on the shared face search pool. Single-face photos (or no Pillow)
+    use one search of the S3 object.
+    Errors are raised to the caller.
+    """
+    if not MULTI_FACE_SEARCH_ENABLED or Image is None:
+        return search_face_matches(image.reference, collection_id, similarity_threshold)
+    face_details = detect_faces(image.reference)[:MAX_FACES_PER_IMAGE]
+    if not face_details:
+        logger.info("No face detected in the image.")
+        return []
+    if len(face_details) == 1 or face_details[0]['BoundingBox'] == FULL_FRAME_BOX:
+        return search_face_matches(image.reference, collection_id, similarity_threshold)
+    crops = crop_faces(image.data, face_details)
+    match_lists = list(get_face_search_executor().map(
+        lambda face_bytes: search_face_crop(face_bytes, collection_id, similarity_threshold), crops
+    ))
+    matches = merge_face_matches(match_lists)
+    logger.info(f"Found {len(matches)} matching family member(s) across {len(crops)} face(s).")
+    return matches
+
+def get_content_hash(image):
+    """
+    Return a content identifier for the S3Image without downloading it: the SHA-256 from a
+    content-addressed key, else the sha256 metadata written by PUT uploads, else the ETag.
+    Returns None when the object cannot be inspected.
+    """
+    match = CONTENT_HASH_KEY_PATTERN.search(image.key)
+    if match:
+        return match.group(1)
+    try:
+        with metrics.stage("s3_head"):
+            head = get_client('s3').head_object(Bucket=image.bucket, Key=image.key)
+    except ClientError as e:
+        logger.error(f"S3 ClientError (HeadObject): {e.response['Error']['Message']}")
+        return None
+    if head.get('Metadata', {}).get('sha256'):
+        return head['Metadata']['sha256']
+    etag = head['ETag'].strip('"')
+    return f"etag-{etag}"
+
+def get_collection_version(revision):
+    """
+    Build the collection version tag stored with cached face search results.
+    """
+    return f"{REKOGNITION_COLLECTION_VERSION}:{revision}"
+
+def get_cached_face_matches(content_hash):
+    """
+    Look up cached face matches for the image hash.
+    Returns (matches or None on a miss, collection revision read with them). The revision is passed
+    to put_cached_face_matches, so a face indexed while the image is searched invalidates the result.
+    Entries written before the collection last changed, or past their TTL, are treated as misses.
+    """
+    now = int(time.time())
+    try:
+        if not FACE_SEARCH_CACHE_TABLE:
+            if not FACE_SEARCH_LOCAL_CACHE_TTL_SECONDS:
+                return None, None
+            with local_cache_lock:
+                revision = local_collection_revision
+                entry = local_face_search_cache.get(content_hash)
+                if entry:
+                    local_face_search_cache.move_to_end(content_hash)
+        else:
+            with metrics.stage("dynamodb_read"):
+                response = get_dynamodb_resource().batch_get_item(
+                    RequestItems={
+                        FACE_SEARCH_CACHE_TABLE: {
+                            'Keys': [
+                                {'content_hash': content_hash},
+                                {'content_hash': COLLECTION_VERSION_ITEM_KEY}
+                            ],
+                            'ConsistentRead': True
+                        }
+                    }
+                )
+            items = {item['content_hash']: item for item in response.get('Responses', {}).get(FACE_SEARCH_CACHE_TABLE, [])}
+            entry = items.get(content_hash)
+            revision = int(items.get(COLLECTION_VERSION_ITEM_KEY, {}).get('revision', 0))
+        
+        if not entry:
+            logger.info(f"Face search cache miss for image hash: {content_hash}")
+            return None, revision
+        if int(entry['expires_at']) <= now or entry['collection_version'] != get_collection_version(revision):
+            logger.info(f"Face search cache entry is stale for image hash: {content_hash}")
+            return None, revision
+        logger.info(f"Face search cache hit for image hash: {content_hash}")
+        return entry['face_matches'], revision
+    except ClientError as e:
+        logger.error(f"DynamoDB ClientError (face search cache read): {e.response['Error']['Message']}")
+        return None, None
+    except Exception as e:
+        logger.error(f"Unexpected error reading face search cache: {str(e)}")
+        return None, None
+
+def put_cached_face_matches(content_hash, matches, revision):
+    """
+    Store the face matches for an image hash, tagged with the collection revision read before the search.
+    Nothing is stored when the revision is unknown (the cache is off or could not be read).
+    The in-process store evicts the least recently used entries above FACE_SEARCH_LOCAL_CACHE_MAX_ENTRIES.
+    """
+    if revision is None:
+        return
+    try:
+        if not FACE_SEARCH_CACHE_TABLE:
+            with local_cache_lock:
+                local_face_search_cache[content_hash] = {
+                    'face_matches': matches,
+                    'collection_version': get_collection_version(revision),
+                    'expires_at': int(time.time()) + min(FACE_SEARCH_LOCAL_CACHE_TTL_SECONDS, FACE_SEARCH_CACHE_TTL_SECONDS)
+                }
+                local_face_search_cache.move_to_end(content_hash)
+                while len(local_face_search_cache) > FACE_SEARCH_LOCAL_CACHE_MAX_ENTRIES:
+                    local_face_search_cache.popitem(last=False)
+            return
+        with metrics.stage("dynamodb_write"):
+            get_dynamodb_resource().Table(FACE_SEARCH_CACHE_TABLE).put_item(
+                Item={
+                    'content_hash': content_hash,
+                    'face_matches': matches,
+                    'collection_version': get_collection_version(revision),
+                    'expires_at': int(time.time()) + FACE_SEARCH_CACHE_TTL_SECONDS
+                }
+            )
+    except ClientError as e:
+        logger.error(f"DynamoDB ClientError (face search cache write): {e.response['Error']['Message']}")
+    except Exception as e:
+        logger.error(f"Unexpected error writing face search cache: {str(e)}")
+
+def bump_collection_revision():
+    """
+    Invalidate every cached face search result after a face is added to the collection.
+    """
+    global local_collection_revision
+    try:
+        if not FACE_SEARCH_CACHE_TABLE:
+            with local_cache_lock:
+                local_collection_revision += 1
+            return
+        with metrics.stage("dynamodb_write"):
+            get_dynamodb_resource().Table(FACE_SEARCH_CACHE_TABLE).update_item(
+                Key={'content_hash': COLLECTION_VERSION_ITEM_KEY},
+                UpdateExpression="ADD revision :one",
+                ExpressionAttributeValues={':one': 1}
+            )
+    except ClientError as e:
+        logger.error(f"DynamoDB ClientError (collection revision): {e.response['Error']['Message']}")
+    except Exception as e:
+        logger.error(f"Unexpected error bumping collection revision: {str(e)}")
+
+def get_cached_search(image):
+    """
+    Look up the S3Image's cached face search result.
+    Returns (content hash, matches or None on a miss, collection revision) for search_faces_cached.
+    """
+    if not FACE_SEARCH_CACHE_TABLE and not FACE_SEARCH_LOCAL_CACHE_TTL_SECONDS:
+        # No cache to consult, so skip the HeadObject behind the content hash
+        return None, None, None
+    content_hash = get_content_hash(image)
+    matches, revision = get_cached_face_matches(content_hash) if content_hash else (None, None)
+    return content_hash, matches, revision
+
+def search_faces_cached(image, collection_id, similarity_threshold, cached_search=None):
+    """
+    Compare every face in the S3Image through the per-hash result cache so repeat images skip Rekognition.
+    cached_search is the get_cached_search result when the caller already looked it up.
+    Throttling, service errors, an open circuit and a failed download are raised so the record fails
+    and is retried; otherwise a registered report would index a duplicate face.
+    """
+    content_hash, matches, revision = cached_search or get_cached_search(image)
+    if matches is not None:
+        return matches
+    try:
+        matches = search_all_faces(image, collection_id, similarity_threshold)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'InvalidParameterException':
+            # Do not cache throttling or service errors as "no match"
+            logger.error(f"Rekognition ClientError (CompareFaces): {e.response['Error']['Message']}")
+            if governor.is_transient(e):
+                raise
+            return []
+        logger.info("No face detected in the image.")
+        matches = []
     except Exception as e:
         logger.error(f"Unexpected error in CompareFaces: {str(e)}")
+        if governor.is_transient(e) or isinstance(e, ImageUnavailableError):
+            raise
         return []
+    if content_hash:
+        put_cached_face_matches(content_hash, matches, revision)
+    return matches
 
-def index_faces(bucket, key, collection_id, family_member_id):
+def check_image_quality(variants, bucket, key):
     """
-    Index a new face into the Rekognition collection.
+    Run the local quality gate on the upload's thumbnail variant.
+    Uploads without one are not checked, so the gate never downloads a full-size original.
+    Returns the rejection reason, or None when the image passes or cannot be checked.
+    """
+    if not image_quality.is_available():
+        return None
+    thumb_bucket, thumb_key = get_variant_location(variants, 'thumb', bucket, key)
+    if (thumb_bucket, thumb_key) == (bucket, key):
+        logger.info(f"Quality gate skipped for {key}: no thumbnail variant.")
+        return None
+    try:
+        sample_bytes = S3Image(thumb_bucket, thumb_key).data
+        with metrics.stage("quality_gate", size=len(sample_bytes)):
+            reason, timings = image_quality.check_image(sample_bytes, image_variants.VARIANTS['thumb']['max_dimension'])
+    except Exception as e:
+        # The gate only saves Rekognition calls; never fail a record because of it
+        logger.warning(f"Quality gate skipped for {key}: {str(e)}")
+        return None
+    for check_name, duration_ms in timings.items():
+        metrics.record(f"quality_{check_name}", duration_ms)
+    logger.info(f"Quality gate for {key}: {reason or 'passed'} ({', '.join(f'{name} {ms:.2f} ms' for name, ms in timings.items())})")
+    return reason
+
+def record_quality_rejection(owner_id, family_member_id, reason):
+    """
+    Record on the family item why its image was rejected by the quality gate.
+    """
+    try:
+        table = get_dynamodb_resource().Table(DYNAMODB_TABLE_NAME)
+        with metrics.stage("dynamodb_write"):
+            table.update_item(
+                Key={
+                    'owner_id': owner_id,
+                    'family_member_id': family_member_id
+                },
+                UpdateExpression="SET quality_rejection = :reason, updated_at = :updated_at",
+                ExpressionAttributeValues={
+                    ':reason': reason,
+                    ':updated_at': datetime.utcnow().isoformat()
+                }
+            )
+    except ClientError as e:
+        logger.error(f"DynamoDB ClientError: {e.response['Error']['Message']}")
+    except Exception as e:
+        logger.error(f"Unexpected error recording quality rejection: {str(e)}")
+
+def index_faces(bucket, key, collection_id, family_member_id, owner_id=None):
+    """
+    Index a new face into the collection through the face matcher backend.
+    owner_id is passed to the shard router as the member's partition.
+    Throttling, service errors and an open circuit are raised so the record is retried.
     """
     try:
         logger.info(f"Indexing face from S3. Bucket: {bucket}, Key: {key}")
-        response = rekognition.index_faces(
-            CollectionId=collection_id,
-            Image={'S3Object': {'Bucket': bucket, 'Name': key}},
-            ExternalImageId=family_member_id,  # Use registered family_member_id
-            DetectionAttributes=['ALL']
-        )
-        face_records = response.get('FaceRecords', [])
-        if face_records:
-            logger.info(f"Indexed {len(face_records)} face(s) for image {key}.")
+        with metrics.stage("rekognition_index"):
+            indexed_count = get_face_matcher().index_face(
+                collection_id,
+                {'S3Object': {'Bucket': bucket, 'Name': key}},
+                family_member_id,  # Use registered family_member_id
+                owner_id
+            )
+        if indexed_count:
+            logger.info(f"Indexed {indexed_count} face(s) for image {key}.")
+            bump_collection_revision()
             return True
         else:
             logger.warning(f"No faces indexed for image {key}.")
             return False
     except ClientError as e:
         logger.error(f"Rekognition ClientError (IndexFaces): {e.response['Error']['Message']}")
+        if governor.is_transient(e):
+            raise
         return False
     except Exception as e:
         logger.error(f"Unexpected error in IndexFaces: {str(e)}")
+        if governor.is_transient(e):
+            raise
         return False
 
-def update_dynamodb(owner_id, family_member_id, matches):
+def update_dynamodb(owner_id, family_member_id, matches, face_collection=None, match_key=None, image_url=None):
     """
-    Update the DynamoDB table with the latest face matches and timestamp.
+    Record the latest face matches: each match is appended to MATCH_HISTORY_TABLE and the family
+    item keeps a compact summary (match_count, latest_match, best_similarity), so its size and the
+    write cost stay constant as matches accumulate.
+    match_key identifies the record (its idempotency key); a redelivered record finds its history
+    already counted and does not count its matches twice.
+    face_collection records the (shard) collection the member's face was indexed into.
+    A quality rejection recorded for an earlier image is cleared.
+    Failing to record the history raises so the record is retried; the summary is best effort.
     """
+    logger.info("Updating DynamoDB.")
+    now = datetime.utcnow().isoformat()
+    key = {
+        'owner_id': owner_id,
+        'family_member_id': family_member_id
+    }
+    recorded = record_match_history(key, image_url, matches, match_key or now, now)
     try:
-        logger.info("Updating DynamoDB.")
-        table = dynamodb.Table(DYNAMODB_TABLE_NAME)
-        response = table.update_item(
-            Key={
-                'owner_id': owner_id,
-                'family_member_id': family_member_id
-            },
-            UpdateExpression="SET face_matches = :matches, updated_at = :updated_at",
-            ExpressionAttributeValues={
-                ':matches': matches,  # Ensure matches contain Decimal types
-                ':updated_at': datetime.utcnow().isoformat()
+        table = get_dynamodb_resource().Table(DYNAMODB_TABLE_NAME)
+        update_expression = "SET updated_at = :updated_at"
+        expression_values = {':updated_at': now}
+        if face_collection:
+            update_expression += ", face_collection = :face_collection"
+            expression_values[':face_collection'] = face_collection
+        if matches:
+            # Matches are sorted by similarity, so the first is the record's best
+            update_expression += ", latest_match = :latest_match"
+            expression_values[':latest_match'] = {
+                'family_member_id': matches[0]['family_member_id'],
+                'Similarity': matches[0]['Similarity'],
+                'matched_at': now
             }
-        )
-        logger.info(f"DynamoDB update response: {response}")
+        update_expression += " REMOVE quality_rejection"
+        with metrics.stage("dynamodb_write"):
+            table.update_item(
+                Key=key,
+                UpdateExpression=update_expression,
+                ExpressionAttributeValues=expression_values
+            )
+        if matches:
+            update_best_similarity(key, matches[0]['Similarity'])
+        logger.info(f"Recorded {recorded} new of {len(matches)} match(es) for {family_member_id}.")
     except ClientError as e:
         logger.error(f"DynamoDB ClientError: {e.response['Error']['Message']}")
     except Exception as e:
         logger.error(f"Unexpected error updating DynamoDB: {str(e)}")
 
+def record_match_history(key, image_url, matches, match_key, matched_at):
+    """
+    Append one small item per match to MATCH_HISTORY_TABLE and count the record's matches in the
+    family item's match_count.
+    The count is a separate conditional write, made in one transaction with the put of the first
+    history item, so a redelivered record finds that item and is not counted again. The other items
+    are written with BatchWriteItem; rewriting them on a retry is harmless.
+    Returns the number of matches counted now.
+    """
+    history_items = [
+        {
+            'family_member_id': key['family_member_id'],
+            'match_id': f"{match_key}#{match['family_member_id']}",
+            'matched_family_member_id': match['family_member_id'],
+            'Similarity': match['Similarity'],
+            'image_url': image_url,
+            'matched_at': matched_at
+        }
+        for match in matches
+    ]
+    if not history_items:
+        return 0
+    recorded = count_match_history(key, history_items[0], len(history_items))
+    write_match_history(key, history_items[1:])
+    return recorded
+
+def count_match_history(key, first_item, match_count):
+    """
+    Put the record's first history item only if its match_id is new and, in the same transaction,
+    add the record's matches to match_count.
+    Returns match_count, or 0 when an earlier delivery already counted the record.
+    """
+    client = get_dynamodb_resource().meta.client  # Serializes Python values like the Table resource
+    try:
+        with metrics.stage("dynamodb_write"):
+            client.transact_write_items(TransactItems=[
+                {'Put': {
+                    'TableName': MATCH_HISTORY_TABLE,
+                    'Item': first_item,
+                    'ConditionExpression': "attribute_not_exists(match_id)"
+                }},
+                {'Update': {
+                    'TableName': DYNAMODB_TABLE_NAME,
+                    'Key': key,
+                    'UpdateExpression': "ADD match_count :count",
+                    'ExpressionAttributeValues': {':count': match_count}
+                }}
+            ])
+        return match_count
+    except ClientError as e:
+        reasons = e.response.get('CancellationReasons') or [{}]
+        if e.response['Error']['Code'] != 'TransactionCanceledException' or reasons[0].get('Code') != 'ConditionalCheckFailed':
+            logger.error(f"Error recording match history for {key['family_member_id']}: {str(e)}")
+            raise
+        logger.info(f"Match {first_item['match_id']} was already recorded; the record is not counted again.")
+        return 0
+
+def write_match_history(key, history_items):
+    """
+    Put history items with BatchWriteItem in groups of 25, retrying unprocessed items with backoff.
+    Raises when items are still unprocessed after MATCH_HISTORY_WRITE_ATTEMPTS, so the record is retried.
+    """
+    client = get_dynamodb_resource().meta.client
+    for start in range(0, len(history_items), DYNAMODB_BATCH_WRITE_SIZE):
+        request = {MATCH_HISTORY_TABLE: [
+            {'PutRequest': {'Item': item}}
+            for item in history_items[start:start + DYNAMODB_BATCH_WRITE_SIZE]
+        ]}
+        for attempt in range(MATCH_HISTORY_WRITE_ATTEMPTS):
+            if attempt:
+                time.sleep(0.05 * 2 ** attempt)
+            try:
+                with metrics.stage("dynamodb_write"):
+                    response = client.batch_write_item(RequestItems=request)
+            except ClientError as e:
+                logger.error(f"Error recording match history for {key['family_member_id']}: {str(e)}")
+                raise
+            request = response.get('UnprocessedItems') or {}
+            if not request:
+                break
+        if request:
+            raise RuntimeError(f"Match history for {key['family_member_id']} was throttled; retrying the record.")
+
+def update_best_similarity(key, similarity):
+    """
+    Raise best_similarity on the family item only if the new similarity is higher.
+    updated_at is bumped again with it, so a GET between the summary write and this one
+    cannot keep a 304 for the old best_similarity.
+    """
+    try:
+        with metrics.stage("dynamodb_write"):
+            get_dynamodb_resource().Table(DYNAMODB_TABLE_NAME).update_item(
+                Key=key,
+                UpdateExpression="SET best_similarity = :similarity, updated_at = :updated_at",
+                ConditionExpression="attribute_not_exists(best_similarity) OR best_similarity < :similarity",
+                ExpressionAttributeValues={':similarity': similarity, ':updated_at': datetime.utcnow().isoformat()}
+            )
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+
 def send_email(recipient, owner_name, subject, body, attachment_bytes, attachment_filename):
     """
     Send an email via SES with the specified parameters and attachment.
+    Throttling, service errors and an open circuit are raised so the record is retried.
     """
     try:
         # Create a multipart email message
@@ -163,39 +756,391 @@ def send_email(recipient, owner_name, subject, body, attachment_bytes, attachmen
         raw_message = msg.as_bytes()
 
         # Send the email via SES
-        response = ses.send_raw_email(
-            Source=SES_SENDER_EMAIL,
-            Destinations=[recipient],
-            RawMessage={'Data': raw_message}
+        with metrics.stage("ses_send", size=len(raw_message)):
+            response = governor.call(
+                'ses',
+                get_ses_client().send_raw_email,
+                Source=SES_SENDER_EMAIL,
+                Destinations=[recipient],
+                RawMessage={'Data': raw_message}
+            )
+        logger.info(f"Email sent to {recipient}. Message ID: {response['MessageId']}")
+    except ClientError as e:
+        logger.error(f"SES ClientError: {e.response['Error']['Message']}")
+        if governor.is_transient(e):
+            raise
+    except Exception as e:
+        logger.error(f"Unexpected error sending email via SES: {str(e)}")
+        if governor.is_transient(e):
+            raise
+
+def notify_owner(notifications, owner_details, subject, message, bucket, key, image):
+    """
+    Queue an owner notification for the batch notification stage.
+    With NOTIFICATION_MODE 'attachment' the email is sent right away with the image attached.
+    notifications is None when an earlier delivery of the record already notified the owners.
+    """
+    if notifications is None:
+        logger.info(f"Owner notification already sent for {key}. Skipping.")
+        return
+    if NOTIFICATION_MODE == "attachment":
+        send_email(
+            recipient=owner_details['email'],
+            owner_name=owner_details['name'],
+            subject=subject,
+            body=f"Dear {owner_details['name']},\n\n{message}\n\nBest Regards,\nSG Find Team",
+            attachment_bytes=image.data,  # Downloaded only for attachment emails
+            attachment_filename=key.split('/')[-1]  # Extract filename from key
         )
+        return
+    notifications.append({
+        'recipient': owner_details['email'],
+        'name': owner_details['name'],
+        'subject': subject,
+        'message': message,
+        'bucket': bucket,
+        'key': key
+    })
+
+def get_image_link(bucket, key):
+    """
+    Create a short-lived presigned URL for the image referenced in a notification.
+    """
+    return get_client('s3').generate_presigned_url(
+        'get_object',
+        Params={'Bucket': bucket, 'Key': key},
+        ExpiresIn=NOTIFICATION_LINK_EXPIRES_IN
+    )
+
+def build_digest(recipient_notifications):
+    """
+    Build the subject and update text of one email covering every notification for a recipient.
+    """
+    if len(recipient_notifications) == 1:
+        subject = recipient_notifications[0]['subject']
+    else:
+        subject = f"Family Member Processing Update: {len(recipient_notifications)} updates"
+    link_hours = NOTIFICATION_LINK_EXPIRES_IN // 3600
+    updates = "\n\n".join(
+        f"{notification['message']}\nView the photo (link valid for {link_hours} hours): "
+        f"{get_image_link(notification['bucket'], notification['key'])}"
+        for notification in recipient_notifications
+    )
+    return subject, updates
+
+def send_digest_email(recipient, owner_name, subject, updates):
+    """
+    Send one plain-text email via SES listing every update for the recipient.
+    Returns True when SES accepted the message.
+    """
+    try:
+        with metrics.stage("ses_send", size=len(updates)):
+            response = governor.call(
+                'ses',
+                get_ses_client().send_email,
+                Source=SES_SENDER_EMAIL,
+                Destination={'ToAddresses': [recipient]},
+                Message={
+                    'Subject': {'Data': subject},
+                    'Body': {'Text': {'Data': f"Dear {owner_name},\n\n{updates}\n\nBest Regards,\nSG Find Team"}}
+                }
+            )
         logger.info(f"Email sent to {recipient}. Message ID: {response['MessageId']}")
+        return True
     except ClientError as e:
         logger.error(f"SES ClientError: {e.response['Error']['Message']}")
+        return False
     except Exception as e:
         logger.error(f"Unexpected error sending email via SES: {str(e)}")
+        return False
+
+def send_bulk_templated_digests(digests):
+    """
+    Send digests with SES_TEMPLATE_NAME in SendBulkTemplatedEmail calls of up to 50 destinations.
+    The template receives name, subject and updates. Returns the recipients that could not be sent.
+    """
+    failed_recipients = set()
+    for start in range(0, len(digests), SES_BULK_MAX_DESTINATIONS):
+        chunk = digests[start:start + SES_BULK_MAX_DESTINATIONS]
+        try:
+            with metrics.stage("ses_send"):
+                response = governor.call(
+                    'ses',
+                    get_ses_client().send_bulk_templated_email,
+                    Source=SES_SENDER_EMAIL,
+                    Template=SES_TEMPLATE_NAME,
+                    DefaultTemplateData=json.dumps({'name': '', 'subject': '', 'updates': ''}),
+                    Destinations=[
+                        {
+                            'Destination': {'ToAddresses': [digest['recipient']]},
+                            'ReplacementTemplateData': json.dumps({
+                                'name': digest['name'],
+                                'subject': digest['subject'],
+                                'updates': digest['updates']
+                            })
+                        }
+                        for digest in chunk
+                    ]
+                )
+            for digest, status in zip(chunk, response.get('Status', [])):
+                if status.get('Status') != 'Success':
+                    logger.error(f"SES bulk send to {digest['recipient']} failed: {status.get('Error')}")
+                    failed_recipients.add(digest['recipient'])
+            logger.info(f"Bulk templated email sent to {len(chunk)} recipient(s).")
+        except ClientError as e:
+            logger.error(f"SES ClientError (bulk): {e.response['Error']['Message']}")
+            failed_recipients.update(digest['recipient'] for digest in chunk)
+        except Exception as e:
+            logger.error(f"Unexpected error sending bulk email via SES: {str(e)}")
+            failed_recipients.update(digest['recipient'] for digest in chunk)
+    return failed_recipients
+
+def build_digests(notifications):
+    """
+    Group the batch's notifications by recipient and build one digest per recipient.
+    Returns (notifications by recipient, digests).
+    """
+    grouped = OrderedDict()
+    for notification in notifications:
+        grouped.setdefault(notification['recipient'], []).append(notification)
+    
+    digests = []
+    for recipient, recipient_notifications in grouped.items():
+        subject, updates = build_digest(recipient_notifications)
+        digests.append({
+            'recipient': recipient,
+            'name': recipient_notifications[0]['name'],
+            'subject': subject,
+            'updates': updates
+        })
+    logger.info(f"Sending {len(digests)} email(s) for {len(notifications)} notification(s).")
+    return grouped, digests
+
+def send_notification_digests(notifications):
+    """
+    Group the batch's notifications by recipient and send one email per recipient.
+    Returns the message ids of records whose notifications could not be sent.
+    """
+    grouped, digests = build_digests(notifications)
+    if SES_TEMPLATE_NAME:
+        failed_recipients = send_bulk_templated_digests(digests)
+    else:
+        failed_recipients = {
+            digest['recipient']
+            for digest in digests
+            if not send_digest_email(digest['recipient'], digest['name'], digest['subject'], digest['updates'])
+        }
+    return get_failed_message_ids(grouped, failed_recipients)
+
+def get_failed_message_ids(grouped, failed_recipients):
+    """
+    Map the recipients that could not be emailed back to the records that notified them.
+    """
+    return {
+        notification['message_id']
+        for recipient in failed_recipients
+        for notification in grouped[recipient]
+    }
+
+def get_idempotency_key(family_member_id, image_url):
+    """
+    Build the ledger key from the message content, so redeliveries and duplicate messages share it.
+    """
+    return hashlib.sha256(f"{family_member_id}|{image_url}".encode('utf-8')).hexdigest()
+
+def claim_ledger_entry(idempotency_key, message_id):
+    """
+    Claim the record in the idempotency ledger with a conditional write.
+    Returns the stages completed by earlier deliveries, or None if the record was already fully processed.
+    Raises if another delivery of the same content currently holds the claim.
+    """
+    if not IDEMPOTENCY_TABLE:
+        return {}
+    now = int(time.time())
+    table = get_dynamodb_resource().Table(IDEMPOTENCY_TABLE)
+    try:
+        with metrics.stage("dynamodb_write"):
+            response = table.update_item(
+                Key={'idempotency_key': idempotency_key},
+                UpdateExpression=(
+                    "SET record_status = :in_progress, lock_expires_at = :lock_expires_at, claimed_by = :claimed_by, "
+                    "expires_at = :expires_at, stages = if_not_exists(stages, :no_stages) "
+                    "ADD message_ids :message_id"
+                ),
+                ConditionExpression=(
+                    "attribute_not_exists(idempotency_key) OR "
+                    "(record_status <> :completed AND (attribute_not_exists(lock_expires_at) OR lock_expires_at < :now))"
+                ),
+                ExpressionAttributeValues={
+                    ':in_progress': 'IN_PROGRESS',
+                    ':completed': 'COMPLETED',
+                    ':now': now,
+                    ':lock_expires_at': now + IDEMPOTENCY_LOCK_SECONDS,
+                    ':claimed_by': message_id,
+                    ':expires_at': now + IDEMPOTENCY_TTL_SECONDS,
+                    ':no_stages': {},
+                    ':message_id': {message_id}
+                },
+                ReturnValues="ALL_NEW"
+            )
+        stages = response['Attributes'].get('stages', {})
+        if stages:
+            logger.info(f"Resuming record {idempotency_key} after completed stages: {sorted(stages)}")
+        return stages
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            raise
+    
+    with metrics.stage("dynamodb_read"):
+        item = table.get_item(Key={'idempotency_key': idempotency_key}, ConsistentRead=True).get('Item', {})
+    if item.get('record_status') == 'COMPLETED':
+        return None
+    raise RuntimeError(f"Record {idempotency_key} is being processed by another delivery.")
+
+def record_ledger_stage(idempotency_key, stage_name, value):
+    """
+    Store the result of a completed stage so a retry can resume after it.
+    """
+    if not IDEMPOTENCY_TABLE:
+        return
+    with metrics.stage("dynamodb_write"):
+        get_dynamodb_resource().Table(IDEMPOTENCY_TABLE).update_item(
+            Key={'idempotency_key': idempotency_key},
+            UpdateExpression="SET stages.#stage = :value",
+            ExpressionAttributeNames={'#stage': stage_name},
+            ExpressionAttributeValues={':value': value}
+        )
+
+def release_ledger_entry(idempotency_key, message_id):
+    """
+    Release the claim of a failed delivery so its retry can resume right away instead of waiting
+    for the lock to expire. Only the delivery that holds the claim releases it; completed stages are kept.
+    """
+    if not IDEMPOTENCY_TABLE or not idempotency_key:
+        return
+    try:
+        with metrics.stage("dynamodb_write"):
+            get_dynamodb_resource().Table(IDEMPOTENCY_TABLE).update_item(
+                Key={'idempotency_key': idempotency_key},
+                UpdateExpression="REMOVE lock_expires_at, claimed_by",
+                ConditionExpression="record_status = :in_progress AND claimed_by = :claimed_by",
+                ExpressionAttributeValues={':in_progress': 'IN_PROGRESS', ':claimed_by': message_id}
+            )
+        logger.info(f"Released the claim on record {idempotency_key}.")
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ConditionalCheckFailedException':
+            logger.error(f"DynamoDB ClientError (ledger release): {e.response['Error']['Message']}")
+    except Exception as e:
+        logger.error(f"Unexpected error releasing idempotency ledger entry {idempotency_key}: {str(e)}")
+
+def complete_ledger_entry(idempotency_key, notified=False):
+    """
+    Mark the record as fully processed and release the claim.
+    """
+    if not IDEMPOTENCY_TABLE or not idempotency_key:
+        return
+    update_expression = "SET record_status = :completed"
+    expression_values = {':completed': 'COMPLETED'}
+    if notified:
+        update_expression += ", stages.notified = :notified"
+        expression_values[':notified'] = True
+    with metrics.stage("dynamodb_write"):
+        get_dynamodb_resource().Table(IDEMPOTENCY_TABLE).update_item(
+            Key={'idempotency_key': idempotency_key},
+            UpdateExpression=update_expression + " REMOVE lock_expires_at, claimed_by",
+            ExpressionAttributeValues=expression_values
+        )
+
+def get_cached_owner(cache_key):
+    """
+    Return cached owner details, or None if missing or expired.
+    """
+    with owner_cache_lock:
+        entry = owner_cache.get(cache_key)
+        if not entry:
+            return None
+        if entry['expires_at'] <= time.time():
+            del owner_cache[cache_key]
+            return None
+        owner_cache.move_to_end(cache_key)
+        return entry['owner']
+
+def put_cached_owner(cache_key, owner):
+    """
+    Cache owner details, evicting the least recently used entries above OWNER_CACHE_MAX_ENTRIES.
+    """
+    with owner_cache_lock:
+        owner_cache[cache_key] = {
+            'owner': owner,
+            'expires_at': time.time() + OWNER_CACHE_TTL_SECONDS
+        }
+        owner_cache.move_to_end(cache_key)
+        while len(owner_cache) > OWNER_CACHE_MAX_ENTRIES:
+            owner_cache.popitem(last=False)
 
 def get_owner_details(owner_id, family_member_id):
+    """
+    Retrieve the owner's contact email and name, served from the in-process cache when possible.
+    """
+    cache_key = (owner_id, family_member_id)
+    owner = get_cached_owner(cache_key)
+    if owner:
+        return owner
+    owner = fetch_owner_details(owner_id, family_member_id)
+    if owner:
+        put_cached_owner(cache_key, owner)
+    return owner
+
+def get_matched_owner_details(matches):
+    """
+    Resolve the owners of every matched family_member_id at once.
+    Cache misses are looked up in parallel. Returns a dict of family_member_id to owner details.
+    """
+    global lookup_executor
+    family_member_ids = list(dict.fromkeys(match['family_member_id'] for match in matches if match.get('family_member_id')))
+    owners = {}
+    missing_ids = []
+    for family_member_id in family_member_ids:
+        owner = get_cached_owner(("unregistered", family_member_id))
+        if owner:
+            owners[family_member_id] = owner
+        else:
+            missing_ids.append(family_member_id)
+    
+    if len(missing_ids) == 1:
+        owners[missing_ids[0]] = get_owner_details("unregistered", missing_ids[0])
+    elif missing_ids:
+        if lookup_executor is None:
+            lookup_executor = ThreadPoolExecutor(max_workers=OWNER_LOOKUP_MAX_WORKERS)
+        results = lookup_executor.map(lambda family_member_id: get_owner_details("unregistered", family_member_id), missing_ids)
+        owners.update(zip(missing_ids, results))
+    logger.info(f"Resolved owners for {len(family_member_ids)} matched family member(s), {len(missing_ids)} from DynamoDB.")
+    return owners
+
+def fetch_owner_details(owner_id, family_member_id):
     """
     Retrieve the owner's contact email and name from the family table based on owner_id and family_member_id.
     For unregistered users (owner_id='unregistered'), use family_member_id to find the registered owner.
     """
     try:
-        family = dynamodb.Table(DYNAMODB_TABLE_NAME)  # Should be 'family'
+        family = get_dynamodb_resource().Table(DYNAMODB_TABLE_NAME)  # Should be 'family'
         
         if owner_id != "unregistered":
             # Registered user report
-            response = family.get_item(
-                Key={
-                    'owner_id': owner_id,
-                    'family_member_id': family_member_id
-                }
-            )
+            with metrics.stage("dynamodb_read"):
+                response = family.get_item(
+                    Key={
+                        'owner_id': owner_id,
+                        'family_member_id': family_member_id
+                    }
+                )
         else:
             # Unregistered user report - find registered owner via family_member_id using GSI
-            response = family.query(
-                IndexName='family_member_id-index',  # Ensure this matches your GSI name
-                KeyConditionExpression=boto3.dynamodb.conditions.Key('family_member_id').eq(family_member_id)
-            )
+            with metrics.stage("dynamodb_read"):
+                response = family.query(
+                    IndexName='family_member_id-index',  # Ensure this matches your GSI name
+                    KeyConditionExpression=Key('family_member_id').eq(family_member_id)
+                )
         
         if 'Item' in response:
             item = response['Item']
@@ -234,126 +1179,543 @@ def get_owner_details(owner_id, family_member_id):
         logger.error(f"Unexpected error retrieving owner details: {str(e)}")
         return None
 
+def start_record(record):
+    """
+    Parse and validate an SQS record and claim it in the idempotency ledger.
+    Returns the record context used by the processing stages, or None when the message is
+    skipped (unprocessable, or fully processed by an earlier delivery).
+    """
+    try:
+        message_body = json.loads(record['body'])
+    except json.JSONDecodeError:
+        logger.error("Message body is not valid JSON. Skipping message.")
+        return None  # Skip unprocessable messages
+    logger.info(f"Processing message: {message_body}")
+    image_url = message_body.get('image_url')
+    purpose = message_body.get('purpose')
+
+    # Validate required fields
+    if not all([image_url, purpose]):
+        logger.error("Missing required message fields. Skipping message.")
+        return None  # Skip unprocessable messages
+
+    # Parse S3 bucket and key
+    bucket, key = parse_s3_url(image_url)
+    if not bucket or not key:
+        logger.error("Invalid S3 URL. Skipping message.")
+        return None  # Skip unprocessable messages
+
+    # Claim the record in the idempotency ledger; stages finished by an earlier delivery are skipped
+    family_member_id = message_body.get('family_member_id')  # Changed to family_member_id
+    idempotency_key = get_idempotency_key(family_member_id, image_url)
+    stages = claim_ledger_entry(idempotency_key, record['messageId'])
+    if stages is None:
+        logger.info("Record was already processed by an earlier delivery. Skipping message.")
+        return None
+    matches, already_indexed = (None, False) if stages.get('matches') is None else split_own_match(stages['matches'], family_member_id)
+
+    # Rekognition reads the object by reference; the bytes are only downloaded for crops or attachments.
+    # Uploads with derivatives are searched and indexed on the Rekognition-sized variant and
+    # notifications use the medium one.
+    image_variants = message_body.get('image_variants') or {}
+    search_bucket, search_key = get_variant_location(image_variants, 'rekognition', bucket, key)
+    notify_bucket, notify_key = get_variant_location(image_variants, 'medium', bucket, key)
+    image = S3Image(search_bucket, search_key)
+    return {
+        'owner_id': message_body.get('owner_id'),
+        'family_member_id': family_member_id,
+        'family_member_name': message_body.get('family_member_name'),  # Changed to family_member_name
+        'image_url': image_url,
+        'bucket': bucket,
+        'key': key,
+        'image_variants': image_variants,
+        'idempotency_key': idempotency_key,
+        'stages': stages,
+        'matches': matches,
+        'already_indexed': already_indexed,
+        'notifications': None if stages.get('notified') else [],
+        'image': image,
+        'notify_bucket': notify_bucket,
+        'notify_key': notify_key,
+        'notify_image': S3Image(notify_bucket, notify_key) if (notify_bucket, notify_key) != (search_bucket, search_key) else image
+    }
+
+def queue_outcome_notification(context, outcome, owner_details, detail=None):
+    """
+    Queue the owner notification for a record outcome: 'rejected' (detail is the reason),
+    'indexed', 'index_failed' or 'found' (detail is the similarity).
+    """
+    family_member_name = context['family_member_name']
+    if outcome == 'rejected':
+        subject = "Family Member Processing Error: Photo Not Usable"
+        message = f"The photo of your family member '{family_member_name}' could not be used for face recognition ({detail.split(':')[0].replace('_', ' ')}).\n\nPlease upload a clear, well-lit photo of their face."
+    elif outcome == 'indexed':
+        subject = "Family Member Processing Update: New Face Indexed"
+        message = f"Your family member '{family_member_name}' has been successfully processed. A new face has been indexed for future recognition."
+    elif outcome == 'index_failed':
+        subject = "Family Member Processing Error: Face Indexing Failed"
+        message = f"There was an error indexing your family member '{family_member_name}'s face for future recognition.\n\nPlease try processing the image again."
+    elif context['owner_id'] != "unregistered":
+        subject = "Family Member Processing Update: Family Member Found"
+        message = f"Great news! Your family member '{family_member_name}' has been found with a confidence level of {detail:.2f}%."
+    else:
+        subject = "Family Member Processing Update: Family Member Found"
+        message = f"A family member matching your missing family member '{family_member_name}' has been found with a confidence level of {detail:.2f}%."
+    notify_owner(
+        context['notifications'],
+        owner_details,
+        subject=subject,
+        message=message,
+        bucket=context['notify_bucket'],
+        key=context['notify_key'],
+        image=context['notify_image']
+    )
+
+def get_match_notifications(matches, matched_owners):
+    """
+    Pair every match with its owner's details. Returns [(owner_details, similarity)].
+    """
+    targets = []
+    for match in matches:
+        matched_family_member_id = match.get('family_member_id')  # Updated to family_member_id
+        if not matched_family_member_id:
+            logger.error("Matched family_member_id is missing. Skipping this match.")
+            continue
+        owner_details = matched_owners.get(matched_family_member_id)
+        if owner_details:
+            targets.append((owner_details, match.get('Similarity')))
+        else:
+            logger.error(f"Could not retrieve owner details for matched_family_member_id: {matched_family_member_id}")
+    return targets
+
+def split_own_match(matches, family_member_id):
+    """
+    Split a raw search result into the matches of other members and whether the record's own member
+    matched. Re-processing a registered photo finds the face indexed from it, which means the member
+    is already indexed; a member missing from the collection (e.g. after a rebuild) does not match.
+    Returns (other matches, already indexed).
+    """
+    others = [match for match in matches if match.get('family_member_id') != family_member_id]
+    return others, len(others) != len(matches)
+
+def run_index_stage(context):
+    """
+    Index the face of a registered report without matches, once per record.
+    Returns whether indexing succeeded.
+    """
+    logger.info("No matching faces found. Indexing the new face.")
+    indexing_success = context['stages'].get('indexed')
+    if indexing_success is None:
+        image = context['image']
+        indexing_success = index_faces(image.bucket, image.key, REKOGNITION_COLLECTION_ID, context['family_member_id'], context['owner_id'])
+        record_ledger_stage(context['idempotency_key'], 'indexed', indexing_success)
+    if indexing_success:
+        logger.info("Successfully indexed the new face.")
+    else:
+        logger.error("Failed to index the new face.")
+    return indexing_success
+
+def run_update_stage(context, face_collection=None, rejection=None):
+    """
+    Write the record's result (or quality rejection) to the family table, once per record.
+    """
+    if context['stages'].get('updated'):
+        return
+    if rejection:
+        record_quality_rejection(context['owner_id'], context['family_member_id'], rejection)
+    else:
+        update_dynamodb(
+            context['owner_id'],
+            context['family_member_id'],  # Updated to family_member_id
+            context['matches'],
+            face_collection,
+            context['idempotency_key'],
+            context['image_url']
+        )
+    record_ledger_stage(context['idempotency_key'], 'updated', True)
+
+def process_record(record):
+    """
+    Process a single SQS record.
+    Unprocessable messages are logged and skipped; retryable failures raise so the record is reported as failed.
+    Returns the owner notifications queued for the batch notification stage.
+    A failure releases the record's ledger claim before it is raised.
+    """
+    context = start_record(record)
+    if context is None:
+        return []
+    try:
+        return process_claimed_record(context)
+    except Exception:
+        release_ledger_entry(context['idempotency_key'], record['messageId'])
+        raise
+
+def process_claimed_record(context):
+    """
+    Run the stages of a record claimed by start_record.
+    """
+    owner_id = context['owner_id']
+    family_member_id = context['family_member_id']
+
+    # Pre-flight quality gate: unusable photos are rejected locally, before any Rekognition call.
+    # Images with a cached search result already passed it.
+    if context['matches'] is None:
+        cached_search = get_cached_search(context['image'])
+        rejection = None
+        if cached_search[1] is None:
+            rejection = check_image_quality(context['image_variants'], context['bucket'], context['key'])
+        if rejection:
+            run_update_stage(context, rejection=rejection)
+            if owner_id != "unregistered":
+                owner_details = get_owner_details(owner_id, family_member_id)
+                if owner_details:
+                    queue_outcome_notification(context, 'rejected', owner_details, rejection)
+            return finish_record(context['idempotency_key'], context['notifications'])
+
+        # Compare faces, reusing the cached result for images seen before
+        search_matches = search_faces_cached(context['image'], REKOGNITION_COLLECTION_ID, SIMILARITY_THRESHOLD, cached_search)
+        context['matches'], context['already_indexed'] = split_own_match(search_matches, family_member_id)
+        record_ledger_stage(context['idempotency_key'], 'matches', search_matches)
+    matches = context['matches']
+
+    face_collection = None
+    if matches:
+        # **Match Found:** Notify the owners of the matched family members
+        logger.info(f"Found {len(matches)} matching face(s). Notifying their owners.")
+        matched_owners = get_matched_owner_details(matches)
+        for owner_details, similarity in get_match_notifications(matches, matched_owners):
+            queue_outcome_notification(context, 'found', owner_details, similarity)
+    elif owner_id != "unregistered" and context['already_indexed']:
+        # **Registered User Report, Already Indexed:** The face matched itself; nothing new to index or report
+        logger.info("No matching faces found. The face is already indexed.")
+        face_collection = get_face_matcher().collection_for(REKOGNITION_COLLECTION_ID, family_member_id, owner_id)
+    elif owner_id != "unregistered":
+        # **Registered User Report, No Match Found:** Index the new face and notify the owner
+        indexing_success = run_index_stage(context)
+        if indexing_success:
+            face_collection = get_face_matcher().collection_for(REKOGNITION_COLLECTION_ID, family_member_id, owner_id)
+        owner_details = get_owner_details(owner_id, family_member_id)
+        if owner_details:
+            queue_outcome_notification(context, 'indexed' if indexing_success else 'index_failed', owner_details)
+    else:
+        # **Unregistered User Report, No Match Found:** Do not index unregistered reports
+        logger.info("No matching faces found. No indexing for unregistered user report.")
+
+    # **Update DynamoDB Regardless of Owner Type**
+    run_update_stage(context, face_collection)
+    logger.info("Successfully processed and updated DynamoDB.")
+    return finish_record(context['idempotency_key'], context['notifications'])
+
+def finish_record(idempotency_key, notifications):
+    """
+    Complete the record's ledger entry, or tag its queued notifications so the batch completes it
+    once they are sent. Returns the queued notifications.
+    """
+    if not notifications:
+        complete_ledger_entry(idempotency_key, notified=notifications is not None and NOTIFICATION_MODE == "attachment")
+        return []
+    for notification in notifications:
+        notification['idempotency_key'] = idempotency_key
+    return notifications
+
+def get_record_executor():
+    """
+    Return the shared thread pool used to process records in parallel.
+    """
+    global record_executor
+    if record_executor is None:
+        record_executor = ThreadPoolExecutor(max_workers=PROCESSOR_MAX_WORKERS)
+    return record_executor
+
+def run_record(record):
+    """
+    Process a record and report whether it succeeded, with the notifications it queued.
+    """
+    try:
+        notifications = process_record(record)
+        for notification in notifications:
+            notification['message_id'] = record['messageId']
+        return True, notifications
+    except Exception as e:
+        logger.error(f"Error processing message {record.get('messageId')}: {str(e)}", exc_info=True)
+        return False, []
+
 def lambda_handler(event, context):
     """
     The main Lambda handler function that processes incoming messages.
+    Records are processed in parallel on up to PROCESSOR_MAX_WORKERS threads (or as overlapping
+    stage DAGs on an event loop with PROCESSOR_ENGINE=asyncio), and failed records
+    are returned as batchItemFailures so only those messages are redelivered
+    (requires ReportBatchItemFailures on the SQS event source mapping).
+    Owner notifications from all records are then sent as one email per recipient.
+    """
+    metrics.start_invocation("processor")
+    try:
+        if PROCESSOR_ENGINE == "asyncio":
+            return asyncio.run(process_batch_async(event))
+        return process_batch(event)
+    finally:
+        metrics.flush()
+
+def process_batch(event):
+    """
+    Process every record in the SQS batch and send the batch's notifications.
     """
     logger.info("Lambda function started processing.")
-    for record in event['Records']:
-        try:
-            message_body = json.loads(record['body'])
-            logger.info(f"Processing message: {message_body}")
-            owner_id = message_body.get('owner_id')
-            family_member_id = message_body.get('family_member_id')  # Changed to family_member_id
-            image_url = message_body.get('image_url')
-            purpose = message_body.get('purpose')
-            family_member_name = message_body.get('family_member_name')  # Changed to family_member_name
-
-            # Validate required fields
-            if not all([image_url, purpose]):
-                logger.error("Missing required message fields. Skipping message.")
-                continue  # Skip unprocessable messages
-
-            # Parse S3 bucket and key
-            bucket, key = parse_s3_url(image_url)
-            if not bucket or not key:
-                logger.error("Invalid S3 URL. Skipping message.")
-                continue  # Skip unprocessable messages
-
-            # Retrieve image from S3
-            image_bytes = get_image_from_s3(bucket, key)
-            if not image_bytes:
-                logger.error("Failed to retrieve image from S3. Skipping message.")
-                continue  # Skip unprocessable messages
-
-            # Compare faces
-            matches = compare_faces(image_bytes, REKOGNITION_COLLECTION_ID, SIMILARITY_THRESHOLD)
+    if metrics.should_log_event():
+        logger.info("Received event: %s", json.dumps(metrics.redact_event(event)))
+    records = event.get('Records', [])
+    
+    if PROCESSOR_MAX_WORKERS > 1 and len(records) > 1:
+        results = list(get_record_executor().map(run_record, records))
+    else:
+        results = [run_record(record) for record in records]
+    
+    failed_message_ids = {
+        record['messageId']
+        for record, (succeeded, _) in zip(records, results)
+        if not succeeded
+    }
+    
+    # Notification stage: coalesce the batch's notifications per recipient
+    notifications = [notification for succeeded, queued in results if succeeded for notification in queued]
+    if notifications:
+        failed_message_ids.update(send_notification_digests(notifications))
+        for idempotency_key in get_notified_keys(notifications, failed_message_ids):
+            complete_notified_record(idempotency_key)
+        for idempotency_key, message_id in get_unnotified_claims(notifications, failed_message_ids):
+            release_ledger_entry(idempotency_key, message_id)
+    return build_batch_response(records, failed_message_ids)
 
-            if owner_id != "unregistered":
-                # **Registered User Report**
-                if not matches:
-                    # **No Match Found:** Index the new face
-                    logger.info("No matching faces found. Indexing the new face.")
-                    indexing_success = index_faces(bucket, key, REKOGNITION_COLLECTION_ID, family_member_id)
-                    if indexing_success:
-                        logger.info("Successfully indexed the new face.")
-                        # **Notify Owner About Indexing**
-                        owner_details = get_owner_details(owner_id, family_member_id)
-                        if owner_details:
-                            send_email(
-                                recipient=owner_details['email'],
-                                owner_name=owner_details['name'],
-                                subject="Family Member Processing Update: New Face Indexed",
-                                body=f"Dear {owner_details['name']},\n\nYour family member '{family_member_name}' has been successfully processed. A new face has been indexed for future recognition.\n\nBest Regards,\nSG Find Team",
-                                attachment_bytes=image_bytes,
-                                attachment_filename=key.split('/')[-1]  # Extract filename from key
-                            )
-                    else:
-                        logger.error("Failed to index the new face.")
-                        # **Notify Owner About Error**
-                        owner_details = get_owner_details(owner_id, family_member_id)
-                        if owner_details:
-                            send_email(
-                                recipient=owner_details['email'],
-                                owner_name=owner_details['name'],
-                                subject="Family Member Processing Error: Face Indexing Failed",
-                                body=f"Dear {owner_details['name']},\n\nThere was an error indexing your family member '{family_member_name}'s face for future recognition.\n\nPlease try processing the image again.\n\nBest Regards,\nSG Find Team",
-                                attachment_bytes=image_bytes,
-                                attachment_filename=key.split('/')[-1]
-                            )
-                else:
-                    # **Match Found:** Notify the owner
-                    logger.info(f"Found {len(matches)} matching face(s). No indexing needed.")
-                    for match in matches:
-                        matched_family_member_id = match.get('family_member_id')  # Updated to family_member_id
-                        similarity = match.get('Similarity')
-                        if not matched_family_member_id:
-                            logger.error("Matched family_member_id is missing. Skipping this match.")
-                            continue
-                        owner_details = get_owner_details("unregistered", matched_family_member_id)
-                        if owner_details:
-                            send_email(
-                                recipient=owner_details['email'],
-                                owner_name=owner_details['name'],
-                                subject="Family Member Processing Update: Family Member Found",
-                                body=f"Dear {owner_details['name']},\n\nGreat news! Your family member '{family_member_name}' has been found with a confidence level of {similarity:.2f}%.\n\nBest Regards,\nSG Find Team",
-                                attachment_bytes=image_bytes,
-                                attachment_filename=key.split('/')[-1]
-                            )
-                        else:
-                            logger.error(f"Could not retrieve owner details for matched_family_member_id: {matched_family_member_id}")
+def get_notified_keys(notifications, failed_message_ids):
+    """
+    Idempotency keys of the records whose notifications were all sent.
+    """
+    return {
+        notification['idempotency_key']
+        for notification in notifications
+        if notification['message_id'] not in failed_message_ids
+    }
+
+def get_unnotified_claims(notifications, failed_message_ids):
+    """
+    (idempotency key, message id) of the records whose notifications could not be sent, to release for their retry.
+    """
+    return {
+        (notification['idempotency_key'], notification['message_id'])
+        for notification in notifications
+        if notification['message_id'] in failed_message_ids
+    }
+
+def complete_notified_record(idempotency_key):
+    try:
+        complete_ledger_entry(idempotency_key, notified=True)
+    except Exception as e:
+        logger.error(f"Error completing idempotency ledger entry {idempotency_key}: {str(e)}")
+
+def build_batch_response(records, failed_message_ids):
+    """
+    Report the failed records as batchItemFailures so only those messages are redelivered.
+    """
+    batch_item_failures = [
+        {'itemIdentifier': record['messageId']}
+        for record in records
+        if record['messageId'] in failed_message_ids
+    ]
+    logger.info(f"Processed {len(records)} record(s) with {len(batch_item_failures)} failure(s).")
+    return {'batchItemFailures': batch_item_failures}
+
+# **Asyncio engine (PROCESSOR_ENGINE=asyncio)**
+# Each record runs as a small DAG of stages on one event loop. The blocking boto3 calls are bridged to
+# a thread pool, so stages that do not depend on each other (owner lookups, the table update, email
+# sends) and the stages of different records overlap, bounded by one semaphore for the whole batch.
+
+class BlockingCallBridge:
+    """
+    Run blocking calls from the event loop on the shared async thread pool,
+    with at most ASYNC_MAX_CONCURRENCY calls in flight across the batch.
+    """
+
+    def __init__(self):
+        self.semaphore = asyncio.Semaphore(ASYNC_MAX_CONCURRENCY)
+
+    async def call(self, function, *args, **kwargs):
+        async with self.semaphore:
+            return await asyncio.get_running_loop().run_in_executor(
+                get_async_executor(), functools.partial(function, *args, **kwargs)
+            )
+
+def get_async_executor():
+    """
+    Return the shared thread pool the asyncio engine runs blocking calls on.
+    """
+    global async_executor
+    if async_executor is None:
+        async_executor = ThreadPoolExecutor(max_workers=ASYNC_MAX_CONCURRENCY)
+    return async_executor
+
+async def lookup_owners_async(bridge, lookups):
+    """
+    Resolve owner details for every (owner_id, family_member_id) at once; cache hits skip the thread pool.
+    Returns a dict of family_member_id to owner details.
+    """
+    owners = {}
+    missing = []
+    for owner_id, family_member_id in dict.fromkeys(lookups):
+        owner = get_cached_owner((owner_id, family_member_id))
+        if owner:
+            owners[family_member_id] = owner
+        else:
+            missing.append((owner_id, family_member_id))
+    results = await asyncio.gather(*(bridge.call(get_owner_details, *lookup) for lookup in missing))
+    owners.update((family_member_id, owner) for (_, family_member_id), owner in zip(missing, results))
+    return owners
+
+async def notify_all_async(bridge, context, targets):
+    """
+    Queue (or, in attachment mode, send) every (outcome, owner details, detail) notification concurrently.
+    """
+    await asyncio.gather(*(
+        bridge.call(queue_outcome_notification, context, outcome, owner_details, detail)
+        for outcome, owner_details, detail in targets
+    ))
+
+async def process_record_async(record, bridge):
+    """
+    Process a single SQS record like process_record, releasing its ledger claim on failure.
+    """
+    context = await bridge.call(start_record, record)
+    if context is None:
+        return []
+    try:
+        return await process_claimed_record_async(context, bridge)
+    except Exception:
+        await bridge.call(release_ledger_entry, context['idempotency_key'], record['messageId'])
+        raise
+
+async def process_claimed_record_async(context, bridge):
+    """
+    Run the stages of a record claimed by start_record like process_claimed_record, overlapping its
+    independent stages: the owner lookup runs alongside indexing, and the table update runs alongside
+    the owner lookups and notifications.
+    """
+    owner_id = context['owner_id']
+    family_member_id = context['family_member_id']
+    registered = owner_id != "unregistered"
+
+    if context['matches'] is None:
+        cached_search = await bridge.call(get_cached_search, context['image'])
+        rejection = None
+        if cached_search[1] is None:
+            rejection = await bridge.call(check_image_quality, context['image_variants'], context['bucket'], context['key'])
+        if rejection:
+            owners = {}
+            update = bridge.call(run_update_stage, context, rejection=rejection)
+            if registered:
+                _, owners = await asyncio.gather(update, lookup_owners_async(bridge, [(owner_id, family_member_id)]))
             else:
-                # **Unregistered User Report**
-                if matches:
-                    # **Match Found:** Notify the registered owner
-                    logger.info(f"Found {len(matches)} matching face(s). Notifying registered owners.")
-                    for match in matches:
-                        matched_family_member_id = match.get('family_member_id')  # Updated to family_member_id
-                        similarity = match.get('Similarity')
-                        if not matched_family_member_id:
-                            logger.error("Matched family_member_id is missing. Skipping this match.")
-                            continue
-                        owner_details = get_owner_details("unregistered", matched_family_member_id)
-                        if owner_details:
-                            send_email(
-                                recipient=owner_details['email'],
-                                owner_name=owner_details['name'],
-                                subject="Family Member Processing Update: Family Member Found",
-                                body=f"Dear {owner_details['name']},\n\nA family member matching your missing family member '{family_member_name}' has been found with a confidence level of {similarity:.2f}%.\n\nBest Regards,\nSG Find Team",
-                                attachment_bytes=image_bytes,
-                                attachment_filename=key.split('/')[-1]
-                            )
-                        else:
-                            logger.error(f"Could not retrieve owner details for matched_family_member_id: {matched_family_member_id}")
-                else:
-                    # **No Match Found:** Do not index unregistered reports
-                    logger.info("No matching faces found. No indexing for unregistered user report.")
-                    # Optionally, notify admin or take other actions
-
-            # **Update DynamoDB Regardless of Owner Type**
-            update_dynamodb(owner_id, family_member_id, matches)  # Updated to family_member_id
-            logger.info("Successfully processed and updated DynamoDB.")
+                await update
+            if owners.get(family_member_id):
+                await notify_all_async(bridge, context, [('rejected', owners[family_member_id], rejection)])
+            return await bridge.call(finish_record, context['idempotency_key'], context['notifications'])
+        matches = await bridge.call(
+            search_faces_cached, context['image'], REKOGNITION_COLLECTION_ID, SIMILARITY_THRESHOLD, cached_search
+        )
+        context['matches'], context['already_indexed'] = split_own_match(matches, family_member_id)
+        # Recorded before any index or update stage, so a retry resumes from the same search result
+        await bridge.call(record_ledger_stage, context['idempotency_key'], 'matches', matches)
+    matches = context['matches']
 
-        except Exception as e:
-            logger.error(f"Error processing message: {str(e)}", exc_info=True)
-            # Optionally, implement additional error handling or retry mechanisms
+    if matches:
+        logger.info(f"Found {len(matches)} matching face(s). Notifying their owners.")
+        lookups = [("unregistered", match['family_member_id']) for match in matches if match.get('family_member_id')]
+        _, matched_owners = await asyncio.gather(
+            bridge.call(run_update_stage, context),
+            lookup_owners_async(bridge, lookups)
+        )
+        await notify_all_async(bridge, context, [
+            ('found', owner_details, similarity)
+            for owner_details, similarity in get_match_notifications(matches, matched_owners)
+        ])
+    elif registered and context['already_indexed']:
+        logger.info("No matching faces found. The face is already indexed.")
+        face_collection = get_face_matcher().collection_for(REKOGNITION_COLLECTION_ID, family_member_id, owner_id)
+        await bridge.call(run_update_stage, context, face_collection)
+    elif registered:
+        indexing_success, owners = await asyncio.gather(
+            bridge.call(run_index_stage, context),
+            lookup_owners_async(bridge, [(owner_id, family_member_id)])
+        )
+        face_collection = get_face_matcher().collection_for(REKOGNITION_COLLECTION_ID, family_member_id, owner_id) if indexing_success else None
+        update = bridge.call(run_update_stage, context, face_collection)
+        if owners.get(family_member_id):
+            await asyncio.gather(update, notify_all_async(bridge, context, [
+                ('indexed' if indexing_success else 'index_failed', owners[family_member_id], None)
+            ]))
+        else:
+            await update
+    else:
+        logger.info("No matching faces found. No indexing for unregistered user report.")
+        await bridge.call(run_update_stage, context)
+
+    logger.info("Successfully processed and updated DynamoDB.")
+    return await bridge.call(finish_record, context['idempotency_key'], context['notifications'])
+
+async def run_record_async(record, bridge):
+    """
+    Process a record on the event loop and report whether it succeeded, with the notifications it queued.
+    """
+    try:
+        notifications = await process_record_async(record, bridge)
+        for notification in notifications:
+            notification['message_id'] = record['messageId']
+        return True, notifications
+    except Exception as e:
+        logger.error(f"Error processing message {record.get('messageId')}: {str(e)}", exc_info=True)
+        return False, []
+
+async def send_notification_digests_async(notifications, bridge):
+    """
+    Send the batch's digests like send_notification_digests, with every recipient's email in flight at once.
+    Returns the message ids of records whose notifications could not be sent.
+    """
+    grouped, digests = build_digests(notifications)
+    if SES_TEMPLATE_NAME:
+        failed_recipients = await bridge.call(send_bulk_templated_digests, digests)
+    else:
+        sent = await asyncio.gather(*(
+            bridge.call(send_digest_email, digest['recipient'], digest['name'], digest['subject'], digest['updates'])
+            for digest in digests
+        ))
+        failed_recipients = {digest['recipient'] for digest, succeeded in zip(digests, sent) if not succeeded}
+    return get_failed_message_ids(grouped, failed_recipients)
+
+async def process_batch_async(event):
+    """
+    Process every record in the SQS batch concurrently on the event loop and send the batch's notifications.
+    """
+    logger.info("Lambda function started processing (asyncio engine).")
+    if metrics.should_log_event():
+        logger.info("Received event: %s", json.dumps(metrics.redact_event(event)))
+    records = event.get('Records', [])
+    bridge = BlockingCallBridge()
+    results = await asyncio.gather(*(run_record_async(record, bridge) for record in records))
+
+    failed_message_ids = {
+        record['messageId']
+        for record, (succeeded, _) in zip(records, results)
+        if not succeeded
+    }
+
+    # Notification stage: coalesce the batch's notifications per recipient
+    notifications = [notification for succeeded, queued in results if succeeded for notification in queued]
+    if notifications:
+        failed_message_ids.update(await send_notification_digests_async(notifications, bridge))
+        await asyncio.gather(*(
+            bridge.call(complete_notified_record, idempotency_key)
+            for idempotency_key in get_notified_keys(notifications, failed_message_ids)
+        ), *(
+            bridge.call(release_ledger_entry, idempotency_key, message_id)
+            for idempotency_key, message_id in get_unnotified_claims(notifications, failed_message_ids)
+        ))
+    return build_batch_response(records, failed_message_ids)
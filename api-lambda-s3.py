@@ -1,37 +1,128 @@
 import json
-import boto3
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from aws_clients import get_client, get_resource  # Lazy clients: a PUT never builds DynamoDB or SQS clients
+import metrics
+import image_variants
 import uuid
 from datetime import datetime
 import logging
 import os
 import base64
-from boto3.dynamodb.conditions import Attr  # Import Attr for scan filters
+import binascii
+import hashlib
+import gzip
+import random
+import time
+import urllib.parse
+from io import BytesIO
+from decimal import Decimal
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+    ImageOps = None
+
+variant_executor = None  # Uploads derivative images in parallel, reused across warm invocations
+bulk_executor = None  # Checks bulk manifest keys and updates existing members in parallel
 
 # Initialize logging
 logger = logging.getLogger()
 logger.setLevel(logging.INFO)
 
-# Initialize AWS clients
-s3 = boto3.client("s3")
-dynamodb = boto3.resource('dynamodb')
-sqs = boto3.client('sqs')
-
 # Configuration: Environment Variables
 S3_BUCKET_NAME = os.environ.get("S3_BUCKET_NAME", "") # Replace with your S3 bucket name
 DYNAMODB_TABLE_NAME = os.environ.get("DYNAMODB_TABLE_NAME", "") # Replace with your DynamoDB table name
 SQS_QUEUE_URL = os.environ.get("SQS_QUEUE_URL", "")  # Replace with your SQS queue URL
 
+# Direct-to-S3 upload settings
+UPLOAD_URL_EXPIRES_IN = int(os.environ.get("UPLOAD_URL_EXPIRES_IN", 900))  # Seconds a presigned URL stays valid
+MULTIPART_THRESHOLD_BYTES = int(os.environ.get("MULTIPART_THRESHOLD_BYTES", 16 * 1024 * 1024))  # Use multipart above this size
+MULTIPART_PART_SIZE_BYTES = int(os.environ.get("MULTIPART_PART_SIZE_BYTES", 8 * 1024 * 1024))  # S3 minimum is 5 MB
+ALLOWED_IMAGE_EXTENSIONS = ['jpeg', 'jpg', 'png', 'gif', 'bmp']
+
+# Upload ingest limits
+MAX_UPLOAD_BYTES = int(os.environ.get("MAX_UPLOAD_BYTES", 10 * 1024 * 1024))  # Largest decoded image accepted by PUT
+MAX_DIRECT_UPLOAD_BYTES = int(os.environ.get("MAX_DIRECT_UPLOAD_BYTES", 50 * 1024 * 1024))  # Largest presigned upload
+MAGIC_BYTES_LENGTH = 12  # Enough decoded bytes to recognise every allowed format
+
+# File signatures of the allowed image formats
+IMAGE_SIGNATURES = [
+    (b"\xff\xd8\xff", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n", "png"),
+    (b"GIF87a", "gif"),
+    (b"GIF89a", "gif"),
+    (b"BM", "bmp")
+]
+
+# Server-side image normalization settings
+IMAGE_NORMALIZATION_ENABLED = os.environ.get("IMAGE_NORMALIZATION_ENABLED", "true").lower() == "true"
+NORMALIZED_MAX_DIMENSION = int(os.environ.get("NORMALIZED_MAX_DIMENSION", 1920))  # Longest side in pixels, enough for Rekognition
+NORMALIZED_JPEG_QUALITY = int(os.environ.get("NORMALIZED_JPEG_QUALITY", 85))
+
+# Content-addressed image keys: identical uploads map to the same object and are stored once
+CONTENT_ADDRESSED_KEYS = os.environ.get("CONTENT_ADDRESSED_KEYS", "true").lower() == "true"
+
+# Namespace for deterministic family_member_id values of registered owners
+FAMILY_MEMBER_ID_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "sg-find/family_member")
+# Opt in while the table still has members created before ids were derived, to reuse their random ids
+LEGACY_FAMILY_MEMBER_LOOKUP = os.environ.get("LEGACY_FAMILY_MEMBER_LOOKUP", "false").lower() == "true"
+
+# Bulk registration (POST /bulk)
+BULK_MAX_RECORDS = int(os.environ.get("BULK_MAX_RECORDS", 500))  # Records accepted per request
+BULK_MAX_RETRIES = int(os.environ.get("BULK_MAX_RETRIES", 5))  # Retries for unprocessed DynamoDB items and failed SQS entries
+BULK_RETRY_BASE_DELAY = float(os.environ.get("BULK_RETRY_BASE_DELAY", 0.05))  # Seconds, doubled on each retry
+BULK_MAX_WORKERS = int(os.environ.get("BULK_MAX_WORKERS", 8))  # Parallel S3 HEADs and updates of existing members
+DYNAMODB_BATCH_WRITE_SIZE = 25  # BatchWriteItem limit
+DYNAMODB_BATCH_GET_SIZE = 100  # BatchGetItem limit
+SQS_BATCH_SIZE = 10  # SendMessageBatch limit
+
+# Read API (GET ?owner_id=...)
+GET_DEFAULT_PAGE_SIZE = int(os.environ.get("GET_DEFAULT_PAGE_SIZE", 25))
+GET_MAX_PAGE_SIZE = int(os.environ.get("GET_MAX_PAGE_SIZE", 100))
+GET_COMPRESSION_MIN_BYTES = int(os.environ.get("GET_COMPRESSION_MIN_BYTES", 1024))  # Smaller responses are sent uncompressed
+# Attributes a GET may return; owner contact details are never exposed
+GET_FIELDS = ["family_member_id", "family_member_name", "image_url", "image_variants", "face_matches", "match_count", "best_similarity", "latest_match", "quality_rejection", "created_at", "updated_at"]
+
+# Match history (GET ?owner_id=...&family_member_id=...): one item per match, written by the processor
+MATCH_HISTORY_TABLE = os.environ.get("MATCH_HISTORY_TABLE") or f"{DYNAMODB_TABLE_NAME}-match-history"
+HISTORY_FIELDS = ["match_id", "matched_family_member_id", "Similarity", "image_url", "matched_at"]
+
 def lambda_handler(event, context):
+    metrics.start_invocation("api")
     try:
-        logger.info("Received event: %s", json.dumps(event))
+        return route_request(event)
+    finally:
+        metrics.flush()
+
+def route_request(event):
+    """
+    Route the API Gateway or S3 event to its handler.
+    """
+    try:
+        # Log a sampled, body-redacted copy of the event instead of the full payload
+        if metrics.should_log_event():
+            logger.info("Received event: %s", json.dumps(metrics.redact_event(event)))
+        
+        # S3 event notifications for objects uploaded with presigned URLs
+        if is_s3_event(event):
+            return handle_s3_upload_event(event)
         
         # Determine HTTP method
         http_method = event.get("httpMethod", "").upper()
         
-        if http_method == "POST":
+        if http_method == "POST" and is_upload_url_request(event):
+            return handle_upload_url(event)
+        elif http_method == "POST" and is_bulk_request(event):
+            return handle_bulk_post(event)
+        elif http_method == "POST":
             return handle_post(event)
         elif http_method == "PUT":
             return handle_put(event)
+        elif http_method == "GET":
+            return handle_get(event)
         else:
             return response(405, {"error": "Method Not Allowed"})
         
@@ -42,14 +133,34 @@ def lambda_handler(event, context):
 def handle_put(event):
     try:
         logger.info("handle_put invoked.")
-        logger.info("Event Data: %s", json.dumps(event))
         
         # Extract the binary data
-        body = event.get("body", "")
+        body = event.get("body") or ""
         is_base64 = event.get("isBase64Encoded", False)
         if not is_base64:
             raise ValueError("Expected 'isBase64Encoded' to be true for binary data.")
-        image_data = base64.b64decode(body)
+        
+        # Reject oversized bodies before decoding anything
+        decoded_size = get_decoded_size(body)
+        if decoded_size > MAX_UPLOAD_BYTES:
+            logger.warning(f"Rejected upload of {decoded_size} bytes (limit {MAX_UPLOAD_BYTES}).")
+            return response(413, {"error": "Image too large", "message": f"Images must be at most {MAX_UPLOAD_BYTES} bytes."})
+        
+        # Check the file signature from the first few bytes only
+        image_format = detect_image_format(read_magic_bytes(body))
+        if not image_format:
+            logger.warning("Rejected upload with an unsupported file signature.")
+            return response(415, {"error": "Unsupported image type", "message": "Allowed formats: jpeg, png, gif, bmp."})
+        
+        # Decode straight from the str into one buffer, then drop the base64 body
+        with metrics.stage("decode") as timer:
+            image_data = binascii.a2b_base64(body)
+            timer.size = len(image_data)
+        event["body"] = None
+        body = None
+        
+        # Hash the decoded bytes for the content-addressed key
+        content_hash = hashlib.sha256(image_data).hexdigest() if CONTENT_ADDRESSED_KEYS else None
         
         # Extract user-id and family member name from query parameters
         query_params = event.get("queryStringParameters") or {}
@@ -57,63 +168,404 @@ def handle_put(event):
         family_member_name = query_params.get("family_member_name")
         
         logger.info(f"User ID: {user_id}, Family Member Name: {family_member_name}")
-
-        if not user_id or not family_member_name:
-            raise ValueError("Missing 'user_id' or 'family_member_name' in query parameters.")
         
-        # For unregistered users, set family_member_name to 'unknown' if not provided
-        if user_id.lower() == "unregistered":
-            if not family_member_name:
-                family_member_name = "unknown"
-                logger.info("Set family_member_name to 'unknown' for unregistered user.")
-        else:
-            if not family_member_name:
-                raise ValueError("Missing 'family_member_name' in query parameters for registered user.")
-
-        # Generate filename as user-id-familymembername with proper sanitization
-        sanitized_family_member_name = ''.join(e for e in family_member_name if e.isalnum() or e in ('-', '_')).replace(' ', '_')
-
-        filename = f"{user_id}-{sanitized_family_member_name}"
-
-        # Generate a unique suffix if the user is unregistered to ensure unique filenames
-        if user_id.lower() == "unregistered":
-            unique_suffix = str(uuid.uuid4())
-            filename += f"-{unique_suffix}"
-            logger.info("Appended UUID to filename for unregistered user: %s", unique_suffix)
-        
-        # Add file extension based on headers
-        content_type = event['headers'].get('Content-Type') or event['headers'].get('content-type')
-        if content_type:
-            extension = content_type.split('/')[-1]
-            if extension in ['jpeg', 'jpg', 'png', 'gif', 'bmp']:
-                filename += f".{extension}"
-            else:
-                filename += ".jpg"  # Default extension
-        else:
-            filename += ".jpg"  # Default extension
+        # Determine the content type (and file extension) from the detected format, not the header
+        content_type = f"image/{image_format}"
+        
+        # Normalize the image before storage so every downstream stage handles fewer bytes
+        normalization = None
+        if IMAGE_NORMALIZATION_ENABLED:
+            with metrics.stage("normalize", size=len(image_data)):
+                normalization = normalize_image(image_data)
+            if normalization and normalization["reencoded"]:
+                image_data = normalization["image_bytes"]
+                content_type = "image/jpeg"
         
-        logger.info(f"Final filename: {filename}")
+        filename = build_image_key(user_id, family_member_name, content_type, content_hash)
 
-        # Upload to S3 without ACL
-        s3.put_object(
-            Bucket=S3_BUCKET_NAME,
-            Key=filename,
-            Body=image_data,
-            ContentType=content_type if content_type else 'image/jpeg'
-            # Removed ACL parameter
+        # Content-addressed objects never change, so they can be cached for a long time
+        cache_control = image_variants.VARIANT_CACHE_CONTROL if content_hash else "no-cache"
+
+        # Identical content is already stored under the same key, so skip the write
+        deduplicated = bool(content_hash) and s3_object_exists(filename)
+        if deduplicated:
+            logger.info(f"Identical image already stored. Skipping S3 upload for: {filename}")
+        else:
+            # Upload to S3 without ACL
+            with metrics.stage("s3_put", size=len(image_data)):
+                get_client('s3').put_object(
+                    Bucket=S3_BUCKET_NAME,
+                    Key=filename,
+                    Body=image_data,
+                    ContentType=content_type if content_type else 'image/jpeg',
+                    CacheControl=cache_control,
+                    Metadata={"sha256": content_hash} if content_hash else {}
+                    # Removed ACL parameter
+                )
+        
+        # Thumbnail, medium and Rekognition-sized copies next to the original
+        variant_urls = store_image_variants(
+            filename,
+            normalization["image"] if normalization else None,
+            image_data,
+            content_type,
+            cache_control,
+            content_hash,
+            deduplicated
         )
         
         # Construct the S3 URL
-        s3_url = f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{filename}"
+        s3_url = build_s3_url(filename)
         
         logger.info("Image uploaded successfully: %s", s3_url)
         
-        return response(200, {"message": "Image uploaded successfully", "file_url": s3_url})
+        result = {"message": "Image uploaded successfully", "file_url": s3_url}
+        if variant_urls:
+            result["image_variants"] = variant_urls
+        if content_hash:
+            result["sha256"] = content_hash
+            result["deduplicated"] = deduplicated
+        if normalization:
+            result["original_bytes"] = normalization["original_bytes"]
+            result["stored_bytes"] = normalization["stored_bytes"]
+        return response(200, result)
     
     except Exception as e:
         logger.error("Error uploading image: %s", str(e), exc_info=True)
         return response(500, {"error": "Failed to upload image", "message": str(e)})
 
+def get_decoded_size(body):
+    """
+    Compute the decoded size of a base64 body without decoding it.
+    """
+    return len(body) * 3 // 4 - body[-2:].count("=")
+
+def read_magic_bytes(body):
+    """
+    Decode only the first MAGIC_BYTES_LENGTH bytes of a base64 body.
+    """
+    try:
+        return binascii.a2b_base64(body[:(MAGIC_BYTES_LENGTH // 3) * 4])
+    except binascii.Error:
+        return b""
+
+def detect_image_format(header_bytes):
+    """
+    Identify the image format from its leading bytes. Returns None for unsupported data.
+    """
+    for signature, image_format in IMAGE_SIGNATURES:
+        if header_bytes.startswith(signature):
+            return image_format
+    return None
+
+def normalize_image(image_data):
+    """
+    Decode the image, apply its EXIF orientation, downscale it to NORMALIZED_MAX_DIMENSION
+    and re-encode it as a metadata-free JPEG.
+    JPEGs that already fit upright, and uploads the re-encode would not shrink, keep their original bytes.
+    Returns a dict with the stored bytes, the decoded image and before/after byte counts, or None to keep the original.
+    """
+    if Image is None:
+        logger.warning("Pillow is not available. Storing the original image bytes.")
+        return None
+    try:
+        with Image.open(BytesIO(image_data)) as img:
+            already_normalized = (
+                img.format == "JPEG"
+                and max(img.size) <= NORMALIZED_MAX_DIMENSION
+                and img.getexif().get(0x0112, 1) == 1  # EXIF orientation: 1 is upright
+            )
+            img = ImageOps.exif_transpose(img)
+            if img.mode != "RGB":
+                img = img.convert("RGB")
+            img.thumbnail((NORMALIZED_MAX_DIMENSION, NORMALIZED_MAX_DIMENSION), Image.LANCZOS)
+            
+            normalized_bytes = None
+            if not already_normalized:
+                # Saving without exif/icc_profile strips all metadata
+                output = BytesIO()
+                img.save(output, format="JPEG", quality=NORMALIZED_JPEG_QUALITY, optimize=True)
+                normalized_bytes = output.getvalue()
+    except Exception as e:
+        logger.error(f"Error normalizing image: {str(e)}. Storing the original image bytes.")
+        return None
+    
+    # Re-encoding an already compressed JPEG can grow it, so keep whichever is smaller
+    reencoded = normalized_bytes is not None and len(normalized_bytes) < len(image_data)
+    stored_bytes = normalized_bytes if reencoded else image_data
+    logger.info(f"Normalized image: {len(image_data)} bytes -> {len(stored_bytes)} bytes, size {img.size[0]}x{img.size[1]}, re-encoded: {reencoded}")
+    return {
+        "image_bytes": stored_bytes,
+        "image": img,
+        "reencoded": reencoded,
+        "original_bytes": len(image_data),
+        "stored_bytes": len(stored_bytes)
+    }
+
+def store_image_variants(key, image, image_data, content_type, cache_control, content_hash, deduplicated):
+    """
+    Write every image_variants.VARIANTS derivative of the upload next to it in parallel.
+    image is the decoded image from normalization (the stored bytes are decoded when it is None).
+    Deduplicated uploads only re-render when their variants are missing.
+    Returns {variant: url}, or {} when variants are disabled or cannot be rendered.
+    """
+    global variant_executor
+    if not image_variants.IMAGE_VARIANTS_ENABLED or Image is None:
+        return {}
+    keys = {variant: image_variants.variant_key(key, variant) for variant in image_variants.VARIANTS}
+    urls = {variant: build_s3_url(variant_key) for variant, variant_key in keys.items()}
+    if deduplicated and s3_object_exists(keys["rekognition"]):
+        return urls
+    try:
+        with metrics.stage("variants", size=len(image_data)):
+            if image is None:
+                with Image.open(BytesIO(image_data)) as decoded:
+                    image = ImageOps.exif_transpose(decoded).convert("RGB")
+            rendered = image_variants.render_variants(image, image_data if content_type == "image/jpeg" else None)
+    except Exception as e:
+        logger.error(f"Error rendering image variants: {str(e)}. Storing the original only.")
+        return {}
+    
+    def put_variant(variant):
+        with metrics.stage("s3_put", size=len(rendered[variant])):
+            get_client('s3').put_object(
+                Bucket=S3_BUCKET_NAME,
+                Key=keys[variant],
+                Body=rendered[variant],
+                ContentType="image/jpeg",
+                CacheControl=cache_control,
+                Metadata={"sha256": content_hash, "variant": variant} if content_hash else {"variant": variant}
+            )
+    
+    if variant_executor is None:
+        variant_executor = ThreadPoolExecutor(max_workers=len(image_variants.VARIANTS))
+    list(variant_executor.map(put_variant, rendered))
+    logger.info("Stored image variants: " + ", ".join(f"{variant} {len(data)} bytes" for variant, data in rendered.items()))
+    return urls
+
+def parse_image_variants(data):
+    """
+    Validate the optional image_variants map ({variant: url}) sent with a POST or bulk record.
+    """
+    variants = data.get("image_variants")
+    if variants is None:
+        return None
+    if not isinstance(variants, dict) or not all(isinstance(url, str) for url in variants.values()):
+        raise ValueError("'image_variants' must map variant names to URLs.")
+    return {variant: url for variant, url in variants.items() if variant in image_variants.VARIANTS}
+
+def build_image_key(user_id, family_member_name, content_type, content_hash=None):
+    """
+    Build the S3 object key for an uploaded image as user-id-familymembername[-uuid].ext.
+    When content_hash is given the key is content-addressed as user-id-familymembername-sha256.ext.
+    Shared by the PUT upload and the presigned upload URL modes.
+    """
+    if not user_id or not family_member_name:
+        raise ValueError("Missing 'user_id' or 'family_member_name' in query parameters.")
+    
+    # For unregistered users, set family_member_name to 'unknown' if not provided
+    if user_id.lower() == "unregistered":
+        if not family_member_name:
+            family_member_name = "unknown"
+            logger.info("Set family_member_name to 'unknown' for unregistered user.")
+    else:
+        if not family_member_name:
+            raise ValueError("Missing 'family_member_name' in query parameters for registered user.")
+
+    # Generate filename as user-id-familymembername with proper sanitization
+    sanitized_family_member_name = ''.join(e for e in family_member_name if e.isalnum() or e in ('-', '_')).replace(' ', '_')
+
+    filename = f"{user_id}-{sanitized_family_member_name}"
+
+    # Content-addressed keys are already unique per image
+    if content_hash:
+        filename += f"-{content_hash}"
+    # Generate a unique suffix if the user is unregistered to ensure unique filenames
+    elif user_id.lower() == "unregistered":
+        unique_suffix = str(uuid.uuid4())
+        filename += f"-{unique_suffix}"
+        logger.info("Appended UUID to filename for unregistered user: %s", unique_suffix)
+    
+    # Add file extension based on content type
+    if content_type:
+        extension = content_type.split('/')[-1]
+        if extension in ALLOWED_IMAGE_EXTENSIONS:
+            filename += f".{extension}"
+        else:
+            filename += ".jpg"  # Default extension
+    else:
+        filename += ".jpg"  # Default extension
+    
+    logger.info(f"Final filename: {filename}")
+    return filename
+
+def s3_object_exists(key):
+    """
+    Check whether an object already exists in the image bucket.
+    """
+    try:
+        with metrics.stage("s3_head"):
+            get_client('s3').head_object(Bucket=S3_BUCKET_NAME, Key=key)
+        return True
+    except ClientError as e:
+        if e.response['Error']['Code'] in ("404", "NoSuchKey", "NotFound"):
+            return False
+        raise
+
+def build_s3_url(key):
+    """
+    Construct the public-style S3 URL stored as image_url and parsed by the processor.
+    """
+    return f"https://{S3_BUCKET_NAME}.s3.amazonaws.com/{key}"
+
+def is_upload_url_request(event):
+    """
+    Check whether a POST targets the presigned upload URL resource (e.g. POST /upload_url).
+    """
+    path = event.get("resource") or event.get("path") or ""
+    return path.rstrip("/").endswith("/upload_url")
+
+def handle_upload_url(event):
+    """
+    Hand out presigned URLs so clients can send image bytes straight to S3.
+    
+    Body actions:
+      - "create" (default): {"user_id", "family_member_name", "content_type", "file_size"}
+        Returns a single presigned PUT URL, or presigned part URLs for a multipart upload
+        when file_size is above MULTIPART_THRESHOLD_BYTES.
+      - "complete": {"key", "upload_id", "parts": [{"PartNumber", "ETag"}]}
+        Completes a multipart upload.
+    """
+    try:
+        logger.info("handle_upload_url invoked.")
+        
+        body = event.get("body") or "{}"
+        if event.get("isBase64Encoded", False):
+            body = base64.b64decode(body).decode('utf-8')
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError as jde:
+            raise ValueError("Invalid JSON format.") from jde
+        
+        action = data.get("action", "create")
+        if action == "create":
+            return response(200, create_upload_urls(data))
+        elif action == "complete":
+            return response(200, complete_multipart_upload(data))
+        else:
+            raise ValueError(f"Unsupported upload action: {action}")
+    
+    except ValueError as e:
+        logger.error("Invalid upload URL request: %s", str(e))
+        return response(400, {"error": "Invalid upload request", "message": str(e)})
+    except Exception as e:
+        logger.error("Error creating upload URL: %s", str(e), exc_info=True)
+        return response(500, {"error": "Failed to create upload URL", "message": str(e)})
+
+def create_upload_urls(data):
+    """
+    Create a presigned PUT URL or a presigned multipart upload for a new image.
+    """
+    content_type = data.get("content_type") or "image/jpeg"
+    if content_type.split('/')[-1] not in ALLOWED_IMAGE_EXTENSIONS:
+        raise ValueError(f"Unsupported content type: {content_type}")
+    try:
+        file_size = int(data.get("file_size") or 0)
+    except (TypeError, ValueError) as e:
+        raise ValueError("'file_size' must be an integer.") from e
+    if file_size > MAX_DIRECT_UPLOAD_BYTES:
+        raise ValueError(f"Images must be at most {MAX_DIRECT_UPLOAD_BYTES} bytes.")
+    
+    key = build_image_key(data.get("user_id"), data.get("family_member_name"), content_type)
+    result = {"key": key, "file_url": build_s3_url(key), "expires_in": UPLOAD_URL_EXPIRES_IN}
+    
+    if file_size <= MULTIPART_THRESHOLD_BYTES:
+        result["method"] = "PUT"
+        result["upload_url"] = get_client('s3').generate_presigned_url(
+            "put_object",
+            Params={"Bucket": S3_BUCKET_NAME, "Key": key, "ContentType": content_type},
+            ExpiresIn=UPLOAD_URL_EXPIRES_IN
+        )
+        logger.info(f"Issued presigned PUT URL for key: {key}")
+        return result
+    
+    multipart = get_client('s3').create_multipart_upload(Bucket=S3_BUCKET_NAME, Key=key, ContentType=content_type)
+    upload_id = multipart["UploadId"]
+    part_count = -(-file_size // MULTIPART_PART_SIZE_BYTES)
+    result["method"] = "MULTIPART"
+    result["upload_id"] = upload_id
+    result["part_size"] = MULTIPART_PART_SIZE_BYTES
+    result["parts"] = [
+        {
+            "PartNumber": part_number,
+            "upload_url": get_client('s3').generate_presigned_url(
+                "upload_part",
+                Params={"Bucket": S3_BUCKET_NAME, "Key": key, "UploadId": upload_id, "PartNumber": part_number},
+                ExpiresIn=UPLOAD_URL_EXPIRES_IN
+            )
+        }
+        for part_number in range(1, part_count + 1)
+    ]
+    logger.info(f"Issued {part_count} presigned part URL(s) for key: {key}")
+    return result
+
+def complete_multipart_upload(data):
+    """
+    Complete a multipart upload from the part ETags the client collected.
+    """
+    key = data.get("key")
+    upload_id = data.get("upload_id")
+    parts = data.get("parts") or []
+    if not key or not upload_id or not parts:
+        raise ValueError("Missing 'key', 'upload_id' or 'parts' for multipart completion.")
+    
+    get_client('s3').complete_multipart_upload(
+        Bucket=S3_BUCKET_NAME,
+        Key=key,
+        UploadId=upload_id,
+        MultipartUpload={
+            "Parts": sorted(
+                ({"PartNumber": int(part["PartNumber"]), "ETag": part["ETag"]} for part in parts),
+                key=lambda part: part["PartNumber"]
+            )
+        }
+    )
+    logger.info(f"Completed multipart upload for key: {key}")
+    return {"message": "Image uploaded successfully", "key": key, "file_url": build_s3_url(key)}
+
+def is_s3_event(event):
+    """
+    Check whether the event is an S3 event notification.
+    """
+    records = event.get("Records") or []
+    return bool(records) and records[0].get("eventSource") == "aws:s3"
+
+def handle_s3_upload_event(event):
+    """
+    Confirm objects uploaded directly to S3 with presigned URLs.
+    Objects that are not an allowed image type are deleted.
+    """
+    confirmed = []
+    for record in event["Records"]:
+        bucket = record["s3"]["bucket"]["name"]
+        key = urllib.parse.unquote_plus(record["s3"]["object"]["key"])
+        try:
+            head = get_client('s3').head_object(Bucket=bucket, Key=key)
+            content_type = head.get("ContentType", "")
+            if not content_type.startswith("image/") or content_type.split('/')[-1] not in ALLOWED_IMAGE_EXTENSIONS:
+                logger.warning(f"Deleting uploaded object with unsupported content type {content_type}: {key}")
+                get_client('s3').delete_object(Bucket=bucket, Key=key)
+                continue
+            if head.get("ContentLength", 0) > MAX_DIRECT_UPLOAD_BYTES:
+                logger.warning(f"Deleting uploaded object over {MAX_DIRECT_UPLOAD_BYTES} bytes: {key}")
+                get_client('s3').delete_object(Bucket=bucket, Key=key)
+                continue
+            logger.info(f"Confirmed upload: {key} ({head.get('ContentLength')} bytes)")
+            confirmed.append(key)
+        except Exception as e:
+            logger.error(f"Error confirming upload {key}: {str(e)}", exc_info=True)
+    return {"confirmed": confirmed}
+
 def handle_post(event):
     try:
         logger.info("Processing POST request.")
@@ -136,6 +588,7 @@ def handle_post(event):
         owner_name = data.get("owner_name", "")
         owner_contact = data.get("owner_contact", "")
         image_url = data.get("image_url")
+        variants = parse_image_variants(data)
         
         logger.info(f"Received data - Purpose: {purpose}, Family Member Name: {family_member_name}, Owner ID: {owner_id}")
         
@@ -147,78 +600,39 @@ def handle_post(event):
             raise ValueError("Missing 'image_url' field.")
         
         # Initialize DynamoDB table
-        table = dynamodb.Table(DYNAMODB_TABLE_NAME)
-        
-        # Check for existing entry if owner is registered
-        existing_item = None
-        if owner_id != "unregistered":
-            logger.info("Owner is registered. Attempting to find existing family member entry.")
-            scan_response = table.scan(
-                FilterExpression=Attr('owner_id').eq(owner_id) & Attr('family_member_name').eq(family_member_name)
-            )
-            items = scan_response.get("Items", [])
-            if items:
-                existing_item = items[0]
-                logger.info("Existing family member entry found.")
-            else:
-                logger.info("No existing family member entry found.")
-        
-        # Generate or reuse family_member_id
-        family_member_id = existing_item.get("family_member_id") if existing_item else str(uuid.uuid4())
-        if not family_member_id:
-            family_member_id = str(uuid.uuid4())
-            logger.info("Generated new family_member_id.")
-        else:
-            logger.info(f"Reusing existing family_member_id: {family_member_id}")
+        table = get_resource('dynamodb').Table(DYNAMODB_TABLE_NAME)
         
-        # Current timestamp
-        updated_at = datetime.utcnow().isoformat()
+        # Derive family_member_id from the key instead of scanning for an existing entry
+        family_member_id = resolve_family_member_id(table, owner_id, family_member_name)
+        logger.info(f"Using family_member_id: {family_member_id}")
         
-        # Prepare item for DynamoDB
-        item = {
-            "owner_id": owner_id,
-            "family_member_id": family_member_id,
-            "owner_name": owner_name,
-            "owner_contact": owner_contact,
-            "family_member_name": family_member_name,
-            "image_url": image_url,
-            "updated_at": updated_at
-        }
-        
-        # Add created_at only for new entries
-        if not existing_item:
-            item["created_at"] = updated_at
-            logger.info("Adding 'created_at' to new DynamoDB item.")
-        
-        # Save or update the item in DynamoDB
-        table.put_item(Item=item)
+        # Create or update the item in one round trip, keeping the original created_at
+        item = upsert_family_member(
+            table,
+            owner_id=owner_id,
+            family_member_id=family_member_id,
+            owner_name=owner_name,
+            owner_contact=owner_contact,
+            family_member_name=family_member_name,
+            image_url=image_url,
+            variant_urls=variants
+        )
         logger.info("Metadata saved successfully in DynamoDB.")
         
         # Determine if a message should be sent to SQS
-        send_sqs = False
-        message_purpose = ""
-        
-        if (owner_id != "unregistered" and purpose == "report_missing_family_member") or \
-           (owner_id == "unregistered" and purpose == "report_found_family_member"):
-            send_sqs = True
-            message_purpose = "process_family_member_status"
-            logger.info("Conditions met for sending message to SQS.")
+        send_sqs = should_send_to_sqs(owner_id, purpose)
         
         if send_sqs:
+            logger.info("Conditions met for sending message to SQS.")
             # Prepare message
-            message = {
-                "owner_id": owner_id,
-                "family_member_id": family_member_id,
-                "family_member_name": family_member_name,
-                "image_url": image_url,
-                "purpose": message_purpose
-            }
+            message = build_sqs_message(item)
             
             # Send message to SQS
-            sqs_response = sqs.send_message(
-                QueueUrl=SQS_QUEUE_URL,
-                MessageBody=json.dumps(message)
-            )
+            with metrics.stage("sqs_send"):
+                sqs_response = get_client('sqs').send_message(
+                    QueueUrl=SQS_QUEUE_URL,
+                    MessageBody=json.dumps(message)
+                )
             
             logger.info("Message sent to SQS with MessageId: %s", sqs_response.get("MessageId"))
             
@@ -238,6 +652,638 @@ def handle_post(event):
         logger.error("Error saving metadata: %s", str(e), exc_info=True)
         return response(500, {"error": "Failed to save metadata", "message": str(e)})
 
+def should_send_to_sqs(owner_id, purpose):
+    """
+    Missing reports from registered owners and found reports from unregistered users are processed.
+    """
+    return (owner_id != "unregistered" and purpose == "report_missing_family_member") or \
+           (owner_id == "unregistered" and purpose == "report_found_family_member")
+
+def build_sqs_message(item):
+    """
+    Build the processor message for a saved family member item.
+    """
+    message = {
+        "owner_id": item["owner_id"],
+        "family_member_id": item["family_member_id"],
+        "family_member_name": item["family_member_name"],
+        "image_url": item["image_url"],
+        "purpose": "process_family_member_status"
+    }
+    if item.get("image_variants"):
+        message["image_variants"] = item["image_variants"]
+    return message
+
+def is_bulk_request(event):
+    """
+    Check whether a POST targets the bulk registration resource (e.g. POST /bulk).
+    """
+    path = event.get("resource") or event.get("path") or ""
+    return path.rstrip("/").endswith("/bulk")
+
+def handle_bulk_post(event):
+    """
+    Register many family members in one request.
+    
+    Body: {"purpose", "owner_id", "owner_name", "owner_contact", "records": [...]}
+    Each record has "family_member_name" and either "image_url" or "key" (an object already
+    uploaded to S3_BUCKET_NAME, e.g. with presigned URLs). Records may override the top-level
+    owner fields and purpose.
+    
+    Manifest keys are checked with parallel HEAD requests. New members are written with
+    BatchWriteItem; members that already exist are updated in place like a single POST, so their
+    match summary, face_collection and other attributes are kept. Messages are sent with
+    SendMessageBatch. The response lists one result per record in request order; it is 207 when
+    some records failed.
+    """
+    try:
+        logger.info("handle_bulk_post invoked.")
+        
+        body = event.get("body") or "{}"
+        if event.get("isBase64Encoded", False):
+            body = base64.b64decode(body).decode('utf-8')
+        try:
+            data = json.loads(body)
+        except json.JSONDecodeError as jde:
+            raise ValueError("Invalid JSON format.") from jde
+        
+        records = data.get("records")
+        if not isinstance(records, list) or not records:
+            raise ValueError("'records' must be a non-empty list.")
+        if len(records) > BULK_MAX_RECORDS:
+            raise ValueError(f"At most {BULK_MAX_RECORDS} records are accepted per request.")
+    
+    except ValueError as e:
+        logger.error("Invalid bulk request: %s", str(e))
+        return response(400, {"error": "Invalid bulk request", "message": str(e)})
+    
+    try:
+        results = [{"index": index} for index in range(len(records))]
+        
+        # Validate everything up front; invalid records are reported and skipped
+        items = {}
+        purposes = {}
+        seen_keys = {}
+        for index, record in enumerate(records):
+            try:
+                item, purpose = build_bulk_item(record, data)
+            except ValueError as e:
+                results[index].update({"status": "error", "error": str(e)})
+                continue
+            key = (item["owner_id"], item["family_member_id"])
+            if key in seen_keys:
+                results[index].update({"status": "error", "error": f"Duplicate of record {seen_keys[key]}."})
+                continue
+            seen_keys[key] = index
+            items[index] = item
+            purposes[index] = purpose
+        
+        # Manifest keys must name uploaded objects
+        manifest_keys = {
+            index: records[index]["key"]
+            for index in items
+            if not records[index].get("image_url")
+        }
+        for index, error in zip(manifest_keys, get_bulk_executor().map(check_manifest_key, manifest_keys.values())):
+            if error:
+                results[index].update({"status": "error", "error": error})
+                del items[index]
+        
+        table = get_resource('dynamodb').Table(DYNAMODB_TABLE_NAME)
+        existing = find_existing_items(table, items)
+        existing.update(find_legacy_items(table, items, existing))
+        write_errors = batch_write_items(table, {index: item for index, item in items.items() if index not in existing})
+        write_errors.update(update_existing_items(table, {index: items[index] for index in existing}))
+        
+        messages = {}
+        for index, item in items.items():
+            results[index]["family_member_id"] = item["family_member_id"]
+            if index in write_errors:
+                results[index].update({"status": "error", "error": write_errors[index]})
+                continue
+            results[index]["status"] = "ok"
+            if should_send_to_sqs(item["owner_id"], purposes[index]):
+                messages[index] = build_sqs_message(item)
+        
+        sent, send_errors = send_sqs_messages(messages)
+        for index, message_id in sent.items():
+            results[index]["sqs_message_id"] = message_id
+        for index, error in send_errors.items():
+            results[index].update({"status": "error", "error": f"Saved but not queued: {error}"})
+        
+        failed = sum(1 for result in results if result["status"] != "ok")
+        logger.info(f"Bulk registration: {len(records) - failed} of {len(records)} records succeeded.")
+        return response(207 if failed else 200, {
+            "message": "Bulk registration processed",
+            "succeeded": len(records) - failed,
+            "failed": failed,
+            "results": results
+        })
+    
+    except Exception as e:
+        logger.error("Error processing bulk registration: %s", str(e), exc_info=True)
+        return response(500, {"error": "Failed to process bulk registration", "message": str(e)})
+
+def build_bulk_item(record, defaults):
+    """
+    Validate one bulk record and build its DynamoDB item. Returns (item, purpose).
+    """
+    if not isinstance(record, dict):
+        raise ValueError("Record must be an object.")
+    purpose = record.get("purpose", defaults.get("purpose"))
+    family_member_name = record.get("family_member_name")
+    owner_id = record.get("owner_id", defaults.get("owner_id", "unregistered"))
+    image_url = record.get("image_url")
+    if not image_url and record.get("key"):
+        image_url = build_s3_url(record["key"])
+    
+    if not purpose:
+        raise ValueError("Missing 'purpose' field.")
+    if not family_member_name:
+        raise ValueError("Missing 'family_member_name' field.")
+    if not image_url:
+        raise ValueError("Missing 'image_url' or 'key' field.")
+    variants = parse_image_variants(record)
+    
+    updated_at = datetime.utcnow().isoformat()
+    item = {
+        "owner_id": owner_id,
+        "family_member_id": derive_family_member_id(owner_id, family_member_name),
+        "owner_name": record.get("owner_name", defaults.get("owner_name", "")),
+        "owner_contact": record.get("owner_contact", defaults.get("owner_contact", "")),
+        "family_member_name": family_member_name,
+        "image_url": image_url,
+        "updated_at": updated_at,
+        "created_at": updated_at
+    }
+    if variants:
+        item["image_variants"] = variants
+    return item, purpose
+
+def retry_delay(attempt):
+    """
+    Exponential backoff with full jitter for bulk retries.
+    """
+    return random.uniform(0, BULK_RETRY_BASE_DELAY * (2 ** attempt))
+
+def get_bulk_executor():
+    global bulk_executor
+    if bulk_executor is None:
+        bulk_executor = ThreadPoolExecutor(max_workers=BULK_MAX_WORKERS)
+    return bulk_executor
+
+def check_manifest_key(key):
+    """
+    Return an error message when a bulk manifest key does not name a readable object, else None.
+    """
+    try:
+        if s3_object_exists(key):
+            return None
+        return f"Object '{key}' was not found."
+    except ClientError as e:
+        logger.error(f"Error checking bulk manifest key {key}: {str(e)}")
+        return f"Object '{key}' could not be checked: {e.response['Error'].get('Code')}"
+
+def find_existing_items(table, items):
+    """
+    Return the indexes of items whose key already exists in the table, read with BatchGetItem.
+    Unregistered reports always have new ids. Keys that could not be read are treated as existing,
+    since updating a new item creates it while putting an existing one would erase its attributes.
+    """
+    keys = {
+        (item["owner_id"], item["family_member_id"]): index
+        for index, item in items.items()
+        if item["owner_id"] != "unregistered"
+    }
+    existing = set()
+    key_list = list(keys)
+    for start in range(0, len(key_list), DYNAMODB_BATCH_GET_SIZE):
+        request = {
+            DYNAMODB_TABLE_NAME: {
+                'Keys': [
+                    {"owner_id": owner_id, "family_member_id": family_member_id}
+                    for owner_id, family_member_id in key_list[start:start + DYNAMODB_BATCH_GET_SIZE]
+                ],
+                'ProjectionExpression': 'owner_id, family_member_id'
+            }
+        }
+        for attempt in range(BULK_MAX_RETRIES + 1):
+            with metrics.stage("dynamodb_read"):
+                batch_response = table.meta.client.batch_get_item(RequestItems=request)
+            for found in batch_response.get('Responses', {}).get(DYNAMODB_TABLE_NAME, []):
+                existing.add(keys[(found["owner_id"], found["family_member_id"])])
+            request = batch_response.get('UnprocessedKeys') or {}
+            if not request:
+                break
+            time.sleep(retry_delay(attempt))
+        else:
+            logger.warning("Could not read some bulk records; updating them in place.")
+            for unread in request[DYNAMODB_TABLE_NAME]['Keys']:
+                existing.add(keys[(unread["owner_id"], unread["family_member_id"])])
+    return existing
+
+def find_legacy_items(table, items, existing):
+    """
+    Point new registered items at members created before family_member_id was derived from the name.
+    Only runs when LEGACY_FAMILY_MEMBER_LOOKUP is on. Each owner with new items is read once; items whose name matches a legacy member take its id and
+    are returned as existing, so they are updated in place instead of duplicated.
+    """
+    legacy = set()
+    new_items = {
+        index: item
+        for index, item in items.items()
+        if index not in existing and item["owner_id"] != "unregistered"
+    }
+    if not LEGACY_FAMILY_MEMBER_LOOKUP or not new_items:
+        return legacy
+    legacy_ids = {owner_id: find_legacy_family_member_ids(table, owner_id) for owner_id in {item["owner_id"] for item in new_items.values()}}
+    for index, item in new_items.items():
+        legacy_id = legacy_ids[item["owner_id"]].get(normalize_family_member_name(item["family_member_name"]))
+        if legacy_id:
+            item["family_member_id"] = legacy_id
+            legacy.add(index)
+    return legacy
+
+def update_existing_items(table, items):
+    """
+    Update members that already exist with the single POST upsert, in parallel.
+    Returns {index: error message} for items that could not be written.
+    """
+    def update(index):
+        item = items[index]
+        try:
+            upsert_family_member(
+                table,
+                item["owner_id"],
+                item["family_member_id"],
+                item["owner_name"],
+                item["owner_contact"],
+                item["family_member_name"],
+                item["image_url"],
+                item.get("image_variants")
+            )
+            return index, None
+        except ClientError as e:
+            logger.error(f"Error updating bulk record {item['family_member_id']}: {str(e)}")
+            return index, str(e)
+    
+    return {index: error for index, error in get_bulk_executor().map(update, list(items)) if error}
+
+def batch_write_items(table, items):
+    """
+    Put items with BatchWriteItem in groups of 25, retrying unprocessed items with backoff.
+    Returns {index: error message} for items that could not be written.
+    """
+    errors = {}
+    indexes = list(items)
+    for start in range(0, len(indexes), DYNAMODB_BATCH_WRITE_SIZE):
+        chunk = indexes[start:start + DYNAMODB_BATCH_WRITE_SIZE]
+        pending = {(items[index]["owner_id"], items[index]["family_member_id"]): index for index in chunk}
+        request = {DYNAMODB_TABLE_NAME: [{'PutRequest': {'Item': items[index]}} for index in chunk]}
+        try:
+            for attempt in range(BULK_MAX_RETRIES + 1):
+                with metrics.stage("dynamodb_write"):
+                    batch_response = table.meta.client.batch_write_item(RequestItems=request)
+                request = batch_response.get('UnprocessedItems') or {}
+                if not request:
+                    break
+                time.sleep(retry_delay(attempt))
+        except ClientError as e:
+            logger.error(f"Error writing bulk records to DynamoDB: {str(e)}")
+            for index in chunk:
+                errors[index] = str(e)
+            continue
+        for unprocessed in request.get(DYNAMODB_TABLE_NAME, []):
+            item = unprocessed['PutRequest']['Item']
+            errors[pending[(item["owner_id"], item["family_member_id"])]] = "DynamoDB write was throttled; retry the record."
+    return errors
+
+def send_sqs_messages(messages):
+    """
+    Send messages with SendMessageBatch in groups of 10, retrying entries that failed on the service side.
+    Returns ({index: MessageId}, {index: error message}).
+    """
+    sent = {}
+    errors = {}
+    indexes = list(messages)
+    for start in range(0, len(indexes), SQS_BATCH_SIZE):
+        pending = indexes[start:start + SQS_BATCH_SIZE]
+        try:
+            for attempt in range(BULK_MAX_RETRIES + 1):
+                with metrics.stage("sqs_send"):
+                    batch_response = get_client('sqs').send_message_batch(
+                        QueueUrl=SQS_QUEUE_URL,
+                        Entries=[
+                            {'Id': str(index), 'MessageBody': json.dumps(messages[index])}
+                            for index in pending
+                        ]
+                    )
+                for success in batch_response.get('Successful', []):
+                    sent[int(success['Id'])] = success['MessageId']
+                pending = []
+                for failure in batch_response.get('Failed', []):
+                    if failure.get('SenderFault'):
+                        errors[int(failure['Id'])] = failure.get('Message', failure['Code'])
+                    else:
+                        pending.append(int(failure['Id']))
+                if not pending:
+                    break
+                time.sleep(retry_delay(attempt))
+        except ClientError as e:
+            logger.error(f"Error sending bulk messages to SQS: {str(e)}")
+        for index in pending:
+            errors[index] = "SQS send failed; retry the record."
+    return sent, errors
+
+def handle_get(event):
+    """
+    List an owner's family members with their match summary, one page per request.
+    
+    Query parameters: owner_id (required), limit, cursor (from the previous page's next_cursor)
+    and fields (comma-separated subset of GET_FIELDS). With family_member_id, the member's match
+    history is listed instead (see handle_get_history).
+    Reads are a Query on the owner_id partition key with a projection, so their cost grows with
+    the page, not the table. The ETag is derived from the page's keys and updated_at values, so a
+    matching If-None-Match returns 304 without serializing the items. Large bodies are gzipped for
+    clients that accept it.
+    """
+    try:
+        logger.info("handle_get invoked.")
+        query_params = event.get("queryStringParameters") or {}
+        owner_id = query_params.get("owner_id")
+        if not owner_id:
+            raise ValueError("Missing 'owner_id' query parameter.")
+        try:
+            limit = int(query_params.get("limit") or GET_DEFAULT_PAGE_SIZE)
+        except ValueError as e:
+            raise ValueError("'limit' must be an integer.") from e
+        if not 1 <= limit <= GET_MAX_PAGE_SIZE:
+            raise ValueError(f"'limit' must be between 1 and {GET_MAX_PAGE_SIZE}.")
+        family_member_id = query_params.get("family_member_id")
+        if family_member_id:
+            start_key = decode_cursor(query_params.get("cursor"), "family_member_id", family_member_id, "match_id")
+            return handle_get_history(event, owner_id, family_member_id, limit, start_key)
+        fields = [field for field in (query_params.get("fields") or "").split(",") if field] or GET_FIELDS
+        unknown_fields = [field for field in fields if field not in GET_FIELDS]
+        if unknown_fields:
+            raise ValueError(f"Unknown fields: {', '.join(unknown_fields)}. Allowed: {', '.join(GET_FIELDS)}.")
+        start_key = decode_cursor(query_params.get("cursor"), "owner_id", owner_id, "family_member_id")
+    except ValueError as e:
+        logger.error("Invalid GET request: %s", str(e))
+        return response(400, {"error": "Invalid request", "message": str(e)})
+    
+    try:
+        # family_member_id and updated_at are always read: they identify the page version for the ETag
+        projected = list(dict.fromkeys(["family_member_id", "updated_at"] + fields))
+        query_kwargs = {
+            "KeyConditionExpression": Key("owner_id").eq(owner_id),
+            "ProjectionExpression": ", ".join(f"#f{index}" for index in range(len(projected))),
+            "ExpressionAttributeNames": {f"#f{index}": field for index, field in enumerate(projected)},
+            "Limit": limit
+        }
+        if start_key:
+            query_kwargs["ExclusiveStartKey"] = start_key
+        table = get_resource('dynamodb').Table(DYNAMODB_TABLE_NAME)
+        with metrics.stage("dynamodb_read"):
+            query_response = table.query(**query_kwargs)
+        items = query_response.get("Items", [])
+        next_cursor = encode_cursor(query_response.get("LastEvaluatedKey"))
+        
+        version = hashlib.sha256(json.dumps(
+            [fields, next_cursor] + [[item["family_member_id"], item.get("updated_at")] for item in items]
+        ).encode('utf-8')).hexdigest()
+        logger.info(f"GET for owner {owner_id} returned {len(items)} item(s).")
+        return page_response(event, version, {
+            "owner_id": owner_id,
+            "items": [{field: item[field] for field in fields if field in item} for item in items],
+            "count": len(items),
+            "next_cursor": next_cursor
+        })
+    
+    except Exception as e:
+        logger.error("Error reading family members: %s", str(e), exc_info=True)
+        return response(500, {"error": "Failed to read family members", "message": str(e)})
+
+def handle_get_history(event, owner_id, family_member_id, limit, start_key):
+    """
+    List one family member's matches from MATCH_HISTORY_TABLE, one page per request, in match_id order.
+    The member must belong to owner_id. History items never change, so the ETag is derived from
+    the page's match_ids.
+    """
+    try:
+        table = get_resource('dynamodb').Table(DYNAMODB_TABLE_NAME)
+        with metrics.stage("dynamodb_read"):
+            member = table.get_item(
+                Key={"owner_id": owner_id, "family_member_id": family_member_id},
+                ProjectionExpression="family_member_id"
+            ).get("Item")
+        if not member:
+            return response(404, {"error": "Not Found", "message": f"No family member {family_member_id} for owner {owner_id}."})
+        
+        query_kwargs = {
+            "KeyConditionExpression": Key("family_member_id").eq(family_member_id),
+            "ProjectionExpression": ", ".join(f"#f{index}" for index in range(len(HISTORY_FIELDS))),
+            "ExpressionAttributeNames": {f"#f{index}": field for index, field in enumerate(HISTORY_FIELDS)},
+            "Limit": limit
+        }
+        if start_key:
+            query_kwargs["ExclusiveStartKey"] = start_key
+        history_table = get_resource('dynamodb').Table(MATCH_HISTORY_TABLE)
+        with metrics.stage("dynamodb_read"):
+            query_response = history_table.query(**query_kwargs)
+        items = query_response.get("Items", [])
+        next_cursor = encode_cursor(query_response.get("LastEvaluatedKey"))
+        
+        version = hashlib.sha256(json.dumps(
+            [family_member_id, next_cursor] + [item["match_id"] for item in items]
+        ).encode('utf-8')).hexdigest()
+        logger.info(f"GET history for {family_member_id} returned {len(items)} match(es).")
+        return page_response(event, version, {
+            "owner_id": owner_id,
+            "family_member_id": family_member_id,
+            "matches": items,
+            "count": len(items),
+            "next_cursor": next_cursor
+        })
+    
+    except Exception as e:
+        logger.error("Error reading match history: %s", str(e), exc_info=True)
+        return response(500, {"error": "Failed to read match history", "message": str(e)})
+
+def page_response(event, version, payload):
+    """
+    Build a GET page response: 304 when If-None-Match carries the page's ETag (derived from
+    version), otherwise the JSON payload, gzipped for clients that accept it when large.
+    """
+    etag = f'"{version[:32]}"'
+    cache_headers = {"ETag": etag, "Cache-Control": "private, no-cache", "Vary": "Accept-Encoding"}
+    if etag in [tag.strip() for tag in get_header(event, "If-None-Match").replace("W/", "").split(",")]:
+        logger.info("GET not modified.")
+        return {"statusCode": 304, "body": "", "headers": build_headers(cache_headers)}
+    
+    body = json.dumps(payload, default=encode_decimal)
+    if len(body) >= GET_COMPRESSION_MIN_BYTES and "gzip" in get_header(event, "Accept-Encoding"):
+        with metrics.stage("compress", size=len(body)):
+            compressed = gzip.compress(body.encode('utf-8'), compresslevel=6)
+        return {
+            "statusCode": 200,
+            "body": base64.b64encode(compressed).decode('ascii'),
+            "isBase64Encoded": True,
+            "headers": build_headers(dict(cache_headers, **{"Content-Encoding": "gzip"}))
+        }
+    return {"statusCode": 200, "body": body, "headers": build_headers(cache_headers)}
+
+def get_header(event, name):
+    """
+    Case-insensitive request header lookup. Returns "" when the header is absent.
+    """
+    name = name.lower()
+    for header, value in (event.get("headers") or {}).items():
+        if header.lower() == name:
+            return value or ""
+    return ""
+
+def encode_cursor(last_evaluated_key):
+    """
+    Turn a LastEvaluatedKey into an opaque URL-safe cursor (None on the last page).
+    """
+    if not last_evaluated_key:
+        return None
+    return base64.urlsafe_b64encode(json.dumps(last_evaluated_key).encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor, partition_key, partition_value, sort_key):
+    """
+    Turn a cursor back into an ExclusiveStartKey, checking it belongs to the requested partition
+    (the owner, or the family member for match history).
+    """
+    if not cursor:
+        return None
+    try:
+        start_key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except (ValueError, binascii.Error) as e:
+        raise ValueError("Invalid 'cursor'.") from e
+    if not isinstance(start_key, dict) or start_key.get(partition_key) != partition_value or sort_key not in start_key:
+        raise ValueError("Invalid 'cursor'.")
+    return start_key
+
+def encode_decimal(value):
+    """
+    json.dumps default for DynamoDB numbers.
+    """
+    if isinstance(value, Decimal):
+        return int(value) if value == value.to_integral_value() else float(value)
+    raise TypeError(f"Object of type {type(value).__name__} is not JSON serializable")
+
+def normalize_family_member_name(family_member_name):
+    """
+    Normalize a family member name so that case and spacing differences map to the same member.
+    """
+    return " ".join(family_member_name.split()).casefold()
+
+def derive_family_member_id(owner_id, family_member_name):
+    """
+    Derive the family_member_id for a POST.
+    Registered owners get a deterministic id from owner_id and the normalized name, so the same
+    member always resolves to the same item without a Scan. Unregistered reports always get a new id.
+    """
+    if owner_id == "unregistered":
+        return str(uuid.uuid4())
+    name_key = f"{owner_id}:{normalize_family_member_name(family_member_name)}"
+    return str(uuid.uuid5(FAMILY_MEMBER_ID_NAMESPACE, name_key))
+
+def resolve_family_member_id(table, owner_id, family_member_name):
+    """
+    Return the family_member_id a POST writes to: the derived id, or the id of a member of the same
+    name created before ids were derived (see find_legacy_family_member_ids), so re-posting that
+    member updates it instead of creating a duplicate. The owner's items are only read when
+    LEGACY_FAMILY_MEMBER_LOOKUP is on and the derived id does not exist yet.
+    """
+    family_member_id = derive_family_member_id(owner_id, family_member_name)
+    if owner_id == "unregistered" or not LEGACY_FAMILY_MEMBER_LOOKUP:
+        return family_member_id
+    with metrics.stage("dynamodb_read"):
+        current = table.get_item(
+            Key={"owner_id": owner_id, "family_member_id": family_member_id},
+            ProjectionExpression="family_member_id"
+        ).get("Item")
+    if current:
+        return family_member_id
+    legacy_id = find_legacy_family_member_ids(table, owner_id).get(normalize_family_member_name(family_member_name))
+    if legacy_id:
+        logger.info(f"Reusing legacy family_member_id: {legacy_id}")
+        return legacy_id
+    return family_member_id
+
+def find_legacy_family_member_ids(table, owner_id):
+    """
+    Map normalized names to the ids of an owner's members whose id is not the derived one
+    (random uuid4 ids from before ids were derived), with one paged Query on the owner's partition.
+    """
+    legacy_ids = {}
+    query_kwargs = {
+        "KeyConditionExpression": Key("owner_id").eq(owner_id),
+        "ProjectionExpression": "family_member_id, family_member_name"
+    }
+    while True:
+        with metrics.stage("dynamodb_read"):
+            query_response = table.query(**query_kwargs)
+        for item in query_response.get("Items", []):
+            family_member_name = item.get("family_member_name")
+            if family_member_name and item["family_member_id"] != derive_family_member_id(owner_id, family_member_name):
+                legacy_ids.setdefault(normalize_family_member_name(family_member_name), item["family_member_id"])
+        if not query_response.get("LastEvaluatedKey"):
+            return legacy_ids
+        query_kwargs["ExclusiveStartKey"] = query_response["LastEvaluatedKey"]
+
+def upsert_family_member(table, owner_id, family_member_id, owner_name, owner_contact, family_member_name, image_url, variant_urls=None):
+    """
+    Create or update a family member item with a single UpdateItem call.
+    created_at is only set the first time the item is written. variant_urls replaces (or removes)
+    the image_variants of the previous image.
+    """
+    updated_at = datetime.utcnow().isoformat()
+    update_expression = (
+        "SET owner_name = :owner_name, owner_contact = :owner_contact, "
+        "family_member_name = :family_member_name, image_url = :image_url, "
+        "updated_at = :updated_at, created_at = if_not_exists(created_at, :updated_at)"
+    )
+    expression_values = {
+        ":owner_name": owner_name,
+        ":owner_contact": owner_contact,
+        ":family_member_name": family_member_name,
+        ":image_url": image_url,
+        ":updated_at": updated_at
+    }
+    if variant_urls:
+        update_expression += ", image_variants = :image_variants"
+        expression_values[":image_variants"] = variant_urls
+    else:
+        update_expression += " REMOVE image_variants"
+    with metrics.stage("dynamodb_write"):
+        update_response = table.update_item(
+            Key={
+                "owner_id": owner_id,
+                "family_member_id": family_member_id
+            },
+            UpdateExpression=update_expression,
+            ExpressionAttributeValues=expression_values,
+            ReturnValues="ALL_NEW"
+        )
+    item = {
+        "owner_id": owner_id,
+        "family_member_id": family_member_id,
+        "owner_name": owner_name,
+        "owner_contact": owner_contact,
+        "family_member_name": family_member_name,
+        "image_url": image_url,
+        "updated_at": updated_at
+    }
+    if variant_urls:
+        item["image_variants"] = variant_urls
+    # created_at comes back from DynamoDB so existing items report their original value
+    item["created_at"] = update_response.get("Attributes", {}).get("created_at", updated_at)
+    return item
+
 def response(status_code, body):
     """
     Formats the HTTP response for API Gateway.
@@ -245,10 +1291,19 @@ def response(status_code, body):
     return {
         "statusCode": status_code,
         "body": json.dumps(body),
-        "headers": {
-            "Content-Type": "application/json",
-            "Access-Control-Allow-Origin": "*",  # Adjust as needed for CORS
-            "Access-Control-Allow-Methods": "OPTIONS,POST,PUT",
-            "Access-Control-Allow-Headers": "Content-Type"
-        }
+        "headers": build_headers()
+    }
+
+def build_headers(extra_headers=None):
+    """
+    Response headers shared by every route, plus any route-specific ones.
+    """
+    headers = {
+        "Content-Type": "application/json",
+        "Access-Control-Allow-Origin": "*",  # Adjust as needed for CORS
+        "Access-Control-Allow-Methods": "OPTIONS,GET,POST,PUT",
+        "Access-Control-Allow-Headers": "Content-Type,If-None-Match",
+        "Access-Control-Expose-Headers": "ETag"
     }
+    headers.update(extra_headers or {})
+    return headers
@@ -0,0 +1,81 @@
+import os
+import threading
+import boto3
+from botocore.config import Config
+
+# Environment variables
+AWS_CONNECT_TIMEOUT = float(os.environ.get("AWS_CONNECT_TIMEOUT", 2))  # Seconds
+AWS_READ_TIMEOUT = float(os.environ.get("AWS_READ_TIMEOUT", 10))  # Seconds
+AWS_MAX_ATTEMPTS = int(os.environ.get("AWS_MAX_ATTEMPTS", 3))
+AWS_RETRY_MODE = os.environ.get("AWS_RETRY_MODE", "standard")
+AWS_MAX_POOL_CONNECTIONS = int(os.environ.get("AWS_MAX_POOL_CONNECTIONS", 10))
+
+# One session shared by every client, created on first use
+session = None
+clients = {}
+client_lock = threading.Lock()
+thread_local = threading.local()
+max_pool_connections = AWS_MAX_POOL_CONNECTIONS
+
+def configure(pool_connections):
+    """
+    Set max_pool_connections for clients that have not been created yet.
+    Handlers call this at import time to match the pool to their own concurrency.
+    """
+    global max_pool_connections
+    if "AWS_MAX_POOL_CONNECTIONS" not in os.environ:
+        max_pool_connections = max(AWS_MAX_POOL_CONNECTIONS, pool_connections)
+
+def get_config(max_attempts=None):
+    """
+    Build the botocore Config shared by all clients.
+    """
+    return Config(
+        connect_timeout=AWS_CONNECT_TIMEOUT,
+        read_timeout=AWS_READ_TIMEOUT,
+        retries={'max_attempts': max_attempts or AWS_MAX_ATTEMPTS, 'mode': AWS_RETRY_MODE},
+        max_pool_connections=max_pool_connections
+    )
+
+def get_session():
+    """
+    Return the shared boto3 session.
+    """
+    global session
+    if session is None:
+        with client_lock:
+            if session is None:
+                session = boto3.session.Session()
+    return session
+
+def get_client(service_name, region_name=None, max_attempts=None):
+    """
+    Return a memoized client for the service. Clients are thread safe and shared across threads.
+    Pass max_attempts=1 for clients whose calls are retried by governor.py instead of botocore.
+    """
+    cache_key = (service_name, region_name, max_attempts)
+    client = clients.get(cache_key)
+    if client is None:
+        aws_session = get_session()
+        with client_lock:
+            client = clients.get(cache_key)
+            if client is None:
+                client = aws_session.client(service_name, region_name=region_name, config=get_config(max_attempts))
+                clients[cache_key] = client
+    return client
+
+def get_resource(service_name):
+    """
+    Return a memoized resource for the current thread.
+    boto3 resources are not thread safe, so each thread gets its own, built from the shared session.
+    """
+    resources = getattr(thread_local, 'resources', None)
+    if resources is None:
+        resources = thread_local.resources = {}
+    resource = resources.get(service_name)
+    if resource is None:
+        aws_session = get_session()
+        with client_lock:
+            resource = aws_session.resource(service_name, config=get_config())
+        resources[service_name] = resource
+    return resource
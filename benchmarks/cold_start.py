@@ -0,0 +1,98 @@
+"""
+Cold-start benchmark for the Lambda handlers.
+
+Each run starts a fresh Python process, imports a handler module and then builds the
+AWS clients its requests need, timing each step. Results are printed as JSON so runs
+can be compared over time:
+
+    python benchmarks/cold_start.py --runs 20 > cold_start.json
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HANDLERS = {
+    "api": {
+        "path": "api-lambda-s3.py",
+        # PUT only needs S3; POST needs DynamoDB and SQS
+        "clients": [["s3"], ["dynamodb:resource", "sqs"]],
+    },
+    "processor": {
+        "path": "ProcessImagetoRekongition&SES.py",
+        "clients": [["s3", "rekognition", "dynamodb:resource", "ses"]],
+    },
+}
+
+# Runs inside the child process: import the handler, then create clients in stages
+CHILD_SCRIPT = """
+import importlib.util, json, sys, time
+sys.path.insert(0, {repo_root!r})
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location("handler", {path!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+timings = {{"import_ms": (time.perf_counter() - start) * 1000}}
+import aws_clients
+for stage, services in enumerate({clients!r}):
+    stage_start = time.perf_counter()
+    for service in services:
+        if service.endswith(":resource"):
+            aws_clients.get_resource(service.split(":")[0])
+        else:
+            aws_clients.get_client(service)
+    timings[f"clients_stage_{{stage}}_ms"] = (time.perf_counter() - stage_start) * 1000
+print(json.dumps(timings))
+"""
+
+def run_once(handler):
+    """
+    Time one cold start of the handler in a fresh interpreter.
+    """
+    config = HANDLERS[handler]
+    script = CHILD_SCRIPT.format(
+        repo_root=REPO_ROOT,
+        path=os.path.join(REPO_ROOT, config["path"]),
+        clients=config["clients"],
+    )
+    env = dict(os.environ)
+    env.setdefault("AWS_DEFAULT_REGION", "us-east-1")
+    env.setdefault("AWS_ACCESS_KEY_ID", "benchmark")
+    env.setdefault("AWS_SECRET_ACCESS_KEY", "benchmark")
+    output = subprocess.run(
+        [sys.executable, "-c", script], env=env, check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(samples):
+    """
+    Reduce per-run timings to median, p90 and max per metric.
+    """
+    summary = {}
+    for metric in samples[0]:
+        values = sorted(sample[metric] for sample in samples)
+        summary[metric] = {
+            "median": round(statistics.median(values), 3),
+            "p90": round(values[min(len(values) - 1, int(len(values) * 0.9))], 3),
+            "max": round(values[-1], 3),
+        }
+    return summary
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=10, help="Cold starts per handler")
+    parser.add_argument("--handler", choices=sorted(HANDLERS), action="append", help="Handler(s) to benchmark (default: all)")
+    args = parser.parse_args()
+
+    results = {"python": sys.version.split()[0], "runs": args.runs, "handlers": {}}
+    for handler in args.handler or sorted(HANDLERS):
+        samples = [run_once(handler) for _ in range(args.runs)]
+        results["handlers"][handler] = summarize(samples)
+    print(json.dumps(results, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,427 @@
+"""
+End-to-end benchmark for both Lambda handlers against local AWS stand-ins.
+
+S3, DynamoDB, SQS and SES are served by moto, and Rekognition is replaced by the
+local NumPy face matcher. Every AWS call can be given an injected latency per
+service. Each scenario runs in a fresh process so peak RSS is per scenario.
+Results are printed (or written with --output) as one JSON object per line:
+
+    pip install moto numpy pillow
+    python benchmarks/e2e.py --latency s3=20,dynamodb=5,sqs=10,ses=30,rekognition=150 --output e2e.jsonl
+
+Scenarios:
+  api_put    PUT uploads through api-lambda-s3.lambda_handler, per image size
+  api_post   POST registrations, per family table size
+  api_bulk   POST /bulk registrations, per records per request (throughput is records/s)
+  processor  SQS batches through the processor lambda_handler, per batch size and table size
+"""
+import argparse
+import base64
+import hashlib
+import json
+import os
+import random
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import importlib.util
+from io import BytesIO
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+BUCKET = "sg-find-benchmark"
+FAMILY_TABLE = "family"
+QUEUE_NAME = "sg-find-benchmark"
+SENDER = "benchmark@example.com"
+COLLECTION_ID = "benchmark"
+
+def parse_list(value, cast=int):
+    return [cast(item) for item in value.split(",") if item]
+
+def parse_latency(value):
+    """
+    Parse "s3=20,dynamodb=5" into {"s3": 0.02, "dynamodb": 0.005} (seconds).
+    """
+    latency = {}
+    for item in parse_list(value, str):
+        service, milliseconds = item.split("=")
+        latency[service] = float(milliseconds) / 1000
+    return latency
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+def make_image(size_bytes):
+    """
+    Build a JPEG of roughly size_bytes (noise compresses poorly, so size tracks pixel count).
+    Falls back to a JPEG signature plus random bytes when Pillow is not installed.
+    """
+    try:
+        from PIL import Image
+    except ImportError:
+        return b"\xff\xd8\xff\xe0" + os.urandom(max(0, size_bytes - 4))
+    side = max(16, int((size_bytes / 1.2) ** 0.5))
+    for _ in range(3):
+        output = BytesIO()
+        Image.effect_noise((side, side), 64).convert("RGB").save(output, format="JPEG", quality=90)
+        ratio = size_bytes / len(output.getvalue())
+        if 0.8 < ratio < 1.25:
+            break
+        side = max(16, int(side * ratio ** 0.5))
+    return output.getvalue()
+
+def unique_image(base_image):
+    """
+    Append a unique trailer so each request has distinct content (JPEG decoders ignore trailing bytes).
+    """
+    return base_image + uuid.uuid4().bytes
+
+class CallRecorder:
+    """
+    botocore event hook that counts AWS calls per service and sleeps for the injected latency.
+    """
+
+    def __init__(self, latency):
+        self.latency = latency
+        self.counts = {}
+        self.lock = threading.Lock()
+
+    def record(self, service):
+        with self.lock:
+            self.counts[service] = self.counts.get(service, 0) + 1
+        delay = self.latency.get(service)
+        if delay:
+            time.sleep(delay)
+
+    def before_call(self, event_name, **kwargs):
+        self.record(event_name.split(".")[1])
+
+    def reset(self):
+        with self.lock:
+            self.counts = {}
+
+def load_module(name, filename):
+    spec = importlib.util.spec_from_file_location(name, os.path.join(REPO_ROOT, filename))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def create_resources():
+    """
+    Create the bucket, tables, queue and SES identity in the moto backend.
+    """
+    import boto3
+    boto3.client("s3").create_bucket(Bucket=BUCKET)
+    boto3.client("dynamodb").create_table(
+        TableName=FAMILY_TABLE,
+        KeySchema=[
+            {"AttributeName": "owner_id", "KeyType": "HASH"},
+            {"AttributeName": "family_member_id", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "owner_id", "AttributeType": "S"},
+            {"AttributeName": "family_member_id", "AttributeType": "S"},
+        ],
+        GlobalSecondaryIndexes=[{
+            "IndexName": "family_member_id-index",
+            "KeySchema": [{"AttributeName": "family_member_id", "KeyType": "HASH"}],
+            "Projection": {"ProjectionType": "ALL"},
+        }],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    boto3.client("dynamodb").create_table(
+        TableName=f"{FAMILY_TABLE}-match-history",
+        KeySchema=[
+            {"AttributeName": "family_member_id", "KeyType": "HASH"},
+            {"AttributeName": "match_id", "KeyType": "RANGE"},
+        ],
+        AttributeDefinitions=[
+            {"AttributeName": "family_member_id", "AttributeType": "S"},
+            {"AttributeName": "match_id", "AttributeType": "S"},
+        ],
+        BillingMode="PAY_PER_REQUEST",
+    )
+    boto3.client("ses").verify_email_identity(EmailAddress=SENDER)
+    return boto3.client("sqs").create_queue(QueueName=QUEUE_NAME)["QueueUrl"]
+
+def seed_family_table(table_size):
+    """
+    Fill the family table with registered members. Returns their (owner_id, family_member_id) keys.
+    """
+    import boto3
+    keys = []
+    with boto3.resource("dynamodb").Table(FAMILY_TABLE).batch_writer() as batch:
+        for index in range(table_size):
+            owner_id = f"owner-{index % 100}"
+            family_member_id = str(uuid.uuid4())
+            batch.put_item(Item={
+                "owner_id": owner_id,
+                "family_member_id": family_member_id,
+                "owner_name": f"Owner {index % 100}",
+                "owner_contact": f"owner{index % 100}@example.com",
+                "family_member_name": f"Member {index}",
+                "image_url": f"https://{BUCKET}.s3.amazonaws.com/seed-{index}.jpg",
+            })
+            keys.append((owner_id, family_member_id))
+    return keys
+
+def run_api_put(api, recorder, params):
+    base_image = make_image(params["image_size"])
+    latencies = []
+    recorder.reset()
+    start = time.perf_counter()
+    for index in range(params["requests"]):
+        event = {
+            "httpMethod": "PUT",
+            "isBase64Encoded": True,
+            "body": base64.b64encode(unique_image(base_image)).decode("ascii"),
+            "headers": {"Content-Type": "image/jpeg"},
+            "queryStringParameters": {"user_id": f"owner-{index}", "family_member_name": "Member"},
+        }
+        request_start = time.perf_counter()
+        result = api.lambda_handler(event, None)
+        latencies.append(time.perf_counter() - request_start)
+        assert result["statusCode"] == 200, result
+    return latencies, time.perf_counter() - start, params["requests"]
+
+def run_api_post(api, recorder, params):
+    seed_family_table(params["table_size"])
+    latencies = []
+    recorder.reset()
+    start = time.perf_counter()
+    for index in range(params["requests"]):
+        event = {
+            "httpMethod": "POST",
+            "body": json.dumps({
+                "purpose": "report_missing_family_member",
+                "family_member_name": f"Member {index}",
+                "owner_id": f"owner-{index % 100}",
+                "owner_name": "Owner",
+                "owner_contact": "owner@example.com",
+                "image_url": f"https://{BUCKET}.s3.amazonaws.com/post-{index}.jpg",
+            }),
+        }
+        request_start = time.perf_counter()
+        result = api.lambda_handler(event, None)
+        latencies.append(time.perf_counter() - request_start)
+        assert result["statusCode"] == 200, result
+    return latencies, time.perf_counter() - start, params["requests"]
+
+def run_api_bulk(api, recorder, params):
+    import boto3
+    seed_family_table(params["table_size"])
+    # Manifest keys name objects uploaded beforehand (e.g. with presigned URLs)
+    s3 = boto3.client("s3")
+    for request in range(params["requests"]):
+        for index in range(params["bulk_size"]):
+            s3.put_object(Bucket=BUCKET, Key=f"bulk-{request}-{index}.jpg", Body=b"\xff\xd8\xff\xe0")
+    latencies = []
+    recorder.reset()
+    start = time.perf_counter()
+    for request in range(params["requests"]):
+        event = {
+            "httpMethod": "POST",
+            "resource": "/bulk",
+            "body": json.dumps({
+                "purpose": "report_missing_family_member",
+                "owner_id": f"owner-{request % 100}",
+                "owner_name": "Owner",
+                "owner_contact": "owner@example.com",
+                "records": [
+                    {"family_member_name": f"Member {request}-{index}", "key": f"bulk-{request}-{index}.jpg"}
+                    for index in range(params["bulk_size"])
+                ],
+            }),
+        }
+        request_start = time.perf_counter()
+        result = api.lambda_handler(event, None)
+        latencies.append(time.perf_counter() - request_start)
+        assert result["statusCode"] == 200, result
+    return latencies, time.perf_counter() - start, params["requests"] * params["bulk_size"]
+
+def run_processor(proc, recorder, params):
+    import boto3
+    s3 = boto3.client("s3")
+    member_keys = seed_family_table(params["table_size"])
+    matcher = proc.get_face_matcher()
+
+    # Index the seeded members; every other record reports a photo of one of them
+    for _, family_member_id in member_keys:
+        matcher.index_face(COLLECTION_ID, {"Bytes": family_member_id.encode()}, family_member_id)
+    base_image = make_image(params["image_size"])
+    batches = []
+    for _ in range(params["requests"]):
+        records = []
+        for position in range(params["batch_size"]):
+            image = unique_image(base_image)
+            # Content-addressed like PUT uploads, so the processor takes the hash from the key
+            key = f"unregistered-unknown-{hashlib.sha256(image).hexdigest()}.jpeg"
+            s3.put_object(Bucket=BUCKET, Key=key, Body=image)
+            if position % 2 == 0 and member_keys:
+                _, matched_id = random.choice(member_keys)
+                matcher.index_face(COLLECTION_ID, {"Bytes": image}, matched_id)
+            records.append({
+                "messageId": str(uuid.uuid4()),
+                "body": json.dumps({
+                    "owner_id": "unregistered",
+                    "family_member_id": str(uuid.uuid4()),
+                    "family_member_name": "unknown",
+                    "image_url": f"https://{BUCKET}.s3.amazonaws.com/{key}",
+                    "purpose": "process_family_member_status",
+                }),
+            })
+        batches.append(records)
+
+    latencies = []
+    recorder.reset()
+    start = time.perf_counter()
+    for records in batches:
+        request_start = time.perf_counter()
+        result = proc.lambda_handler({"Records": records}, None)
+        latencies.append(time.perf_counter() - request_start)
+        assert not result["batchItemFailures"], result
+    return latencies, time.perf_counter() - start, params["requests"] * params["batch_size"]
+
+def run_scenario(scenario):
+    """
+    Run one scenario inside this process and return its result record.
+    """
+    from moto import mock_aws
+
+    index_dir = tempfile.mkdtemp(prefix="sg-find-face-index-")
+    os.environ.update({
+        "AWS_DEFAULT_REGION": "us-east-1",
+        "AWS_ACCESS_KEY_ID": "benchmark",
+        "AWS_SECRET_ACCESS_KEY": "benchmark",
+        "S3_BUCKET_NAME": BUCKET,
+        "DYNAMODB_TABLE_NAME": FAMILY_TABLE,
+        "REKOGNITION_COLLECTION_ID": COLLECTION_ID,
+        "SES_SENDER_EMAIL": SENDER,
+        "SES_REGION": "us-east-1",
+        "FACE_MATCHER_BACKEND": "numpy",
+        "FACE_INDEX_DIR": index_dir,
+        "METRICS_SAMPLE_RATE": "0",
+        "EVENT_LOG_SAMPLE_RATE": "0",
+    })
+    sys.path.insert(0, REPO_ROOT)
+    params = scenario["params"]
+    latency = scenario["latency"]
+    try:
+        with mock_aws():
+            os.environ["SQS_QUEUE_URL"] = create_resources()
+            import aws_clients
+            import face_matchers
+            recorder = CallRecorder(latency)
+            aws_clients.get_session().events.register("before-call", recorder.before_call)
+
+            if scenario["name"] == "processor":
+                proc = load_module("processor", "ProcessImagetoRekongition&SES.py")
+
+                # Stand-in for Rekognition with the same call accounting and latency
+                class RecordedFaceMatcher(face_matchers.NumpyFaceMatcher):
+                    def detect_faces(self, *args, **kwargs):
+                        recorder.record("rekognition")
+                        return super().detect_faces(*args, **kwargs)
+
+                    def search_faces(self, *args, **kwargs):
+                        recorder.record("rekognition")
+                        return super().search_faces(*args, **kwargs)
+
+                    def index_face(self, *args, **kwargs):
+                        recorder.record("rekognition")
+                        return super().index_face(*args, **kwargs)
+
+                proc.face_matcher = RecordedFaceMatcher(index_dir=index_dir, image_loader=proc.get_image_from_s3)
+                latencies, elapsed, units = run_processor(proc, recorder, params)
+            else:
+                api = load_module("api", "api-lambda-s3.py")
+                runner = {"api_put": run_api_put, "api_post": run_api_post, "api_bulk": run_api_bulk}[scenario["name"]]
+                latencies, elapsed, units = runner(api, recorder, params)
+    finally:
+        shutil.rmtree(index_dir, ignore_errors=True)
+
+    return {
+        "scenario": scenario["name"],
+        "params": params,
+        "injected_latency_ms": {service: delay * 1000 for service, delay in latency.items()},
+        "requests": len(latencies),
+        "throughput_per_s": round(units / elapsed, 3),
+        "latency_ms": {
+            "mean": round(statistics.mean(latencies) * 1000, 3),
+            "p50": round(percentile(latencies, 0.50) * 1000, 3),
+            "p99": round(percentile(latencies, 0.99) * 1000, 3),
+        },
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "aws_calls_per_request": {
+            service: round(count / len(latencies), 3) for service, count in sorted(recorder.counts.items())
+        },
+    }
+
+def build_scenarios(args):
+    latency = parse_latency(args.latency)
+    scenarios = []
+    for image_size in parse_list(args.image_sizes):
+        scenarios.append({"name": "api_put", "params": {"image_size": image_size * 1024, "requests": args.requests}})
+    for table_size in parse_list(args.table_sizes):
+        scenarios.append({"name": "api_post", "params": {"table_size": table_size, "requests": args.requests}})
+    for bulk_size in parse_list(args.bulk_sizes):
+        scenarios.append({"name": "api_bulk", "params": {
+            "table_size": parse_list(args.table_sizes)[-1],
+            "bulk_size": bulk_size,
+            "requests": args.requests,
+        }})
+    for table_size in parse_list(args.table_sizes):
+        for batch_size in parse_list(args.batch_sizes):
+            scenarios.append({"name": "processor", "params": {
+                "table_size": table_size,
+                "batch_size": batch_size,
+                "image_size": args.processor_image_size * 1024,
+                "requests": args.requests,
+            }})
+    for scenario in scenarios:
+        scenario["latency"] = latency
+    return [scenario for scenario in scenarios if not args.scenario or scenario["name"] in args.scenario]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenario", choices=["api_put", "api_post", "api_bulk", "processor"], action="append", help="Scenario(s) to run (default: all)")
+    parser.add_argument("--requests", type=int, default=20, help="Requests (or SQS batches) per scenario")
+    parser.add_argument("--image-sizes", default="100,1000,5000", help="PUT image sizes in KB")
+    parser.add_argument("--table-sizes", default="0,1000", help="Family table sizes")
+    parser.add_argument("--batch-sizes", default="1,5,10", help="SQS batch sizes")
+    parser.add_argument("--bulk-sizes", default="10,100", help="Records per bulk registration request")
+    parser.add_argument("--processor-image-size", type=int, default=200, help="Processor image size in KB")
+    parser.add_argument("--latency", default="", help="Injected latency per service in ms, e.g. s3=20,rekognition=150")
+    parser.add_argument("--output", help="Append JSON lines to this file instead of printing them")
+    parser.add_argument("--run-scenario", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_scenario:
+        print(json.dumps(run_scenario(json.loads(args.run_scenario))))
+        return
+
+    output = open(args.output, "a") if args.output else sys.stdout
+    try:
+        for scenario in build_scenarios(args):
+            completed = subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--run-scenario", json.dumps(scenario)],
+                check=True, capture_output=True, text=True
+            )
+            result = json.loads(completed.stdout.strip().splitlines()[-1])
+            result["timestamp"] = int(time.time())
+            result["python"] = sys.version.split()[0]
+            output.write(json.dumps(result) + "\n")
+            output.flush()
+    finally:
+        if output is not sys.stdout:
+            output.close()
+
+if __name__ == "__main__":
+    main()
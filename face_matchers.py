@@ -0,0 +1,358 @@
+import abc
+import json
+import os
+import hashlib
+import importlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from botocore.exceptions import ClientError
+from aws_clients import get_client
+import governor
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Initialize logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+FACE_MATCHER_BACKEND = os.environ.get("FACE_MATCHER_BACKEND", "rekognition")  # "rekognition" or "numpy"
+FACE_INDEX_DIR = os.environ.get("FACE_INDEX_DIR", "/tmp/face-index")  # Local (or EFS) directory for the NumPy index
+FACE_EMBEDDING_DIM = int(os.environ.get("FACE_EMBEDDING_DIM", 128))
+FACE_EMBEDDER = os.environ.get("FACE_EMBEDDER", "")  # "module:function" returning an embedding for image bytes
+FACE_INDEX_INITIAL_CAPACITY = int(os.environ.get("FACE_INDEX_INITIAL_CAPACITY", 1024))
+INDEX_MAX_FACES = int(os.environ.get("INDEX_MAX_FACES", 1))  # Faces indexed per registration photo (largest first)
+INDEX_QUALITY_FILTER = os.environ.get("INDEX_QUALITY_FILTER", "AUTO")  # NONE, AUTO, LOW, MEDIUM or HIGH
+
+# Sharded collections: shard 0 is the collection id itself, shard i > 0 is "<collection id>-<i>"
+FACE_COLLECTION_SHARDS = int(os.environ.get("FACE_COLLECTION_SHARDS", 1))  # 1 = a single collection
+FACE_SHARD_ROUTER = os.environ.get("FACE_SHARD_ROUTER", "")  # "module:function(external_image_id, shard_count, partition)" returning a shard index
+FACE_SHARD_MAX_WORKERS = int(os.environ.get("FACE_SHARD_MAX_WORKERS", 8))  # Concurrent shard searches
+
+# Bounding box covering the whole image, in Rekognition's ratio format
+FULL_FRAME_BOX = {'Width': 1.0, 'Height': 1.0, 'Left': 0.0, 'Top': 0.0}
+
+class FaceMatcher(abc.ABC):
+    """
+    Interface the processor uses to search and index faces.
+    Images use the Rekognition Image shape: {'Bytes': ...} or {'S3Object': {'Bucket': ..., 'Name': ...}}.
+    Search results use the Rekognition FaceMatches shape: [{'Similarity': float, 'Face': {'ExternalImageId': ...}}].
+    Detected faces use the Rekognition FaceDetails shape: [{'BoundingBox': {...}, 'Confidence': float}].
+    """
+
+    def detect_faces(self, image):
+        """
+        Locate the faces in an image. Backends without a detector treat the whole image as one face.
+        """
+        return [{'BoundingBox': dict(FULL_FRAME_BOX), 'Confidence': 100.0}]
+
+    def collection_for(self, collection_id, external_image_id, partition=None):
+        """
+        Return the collection that holds (or will hold) faces indexed under external_image_id.
+        partition is the attribute a shard router may group faces by (the processor passes the owner_id).
+        """
+        return collection_id
+
+    def create_collection(self, collection_id):
+        """
+        Create the collection if it does not exist. Backends that create collections on demand need nothing.
+        """
+
+    @abc.abstractmethod
+    def search_faces(self, collection_id, image, similarity_threshold, max_faces):
+        """
+        Search the collection for the faces in an image. Returns a FaceMatches list.
+        """
+
+    def search_faces_batch(self, collection_id, images, similarity_threshold, max_faces):
+        """
+        Search several images at once. Returns one FaceMatches list per image.
+        """
+        return [self.search_faces(collection_id, image, similarity_threshold, max_faces) for image in images]
+
+    @abc.abstractmethod
+    def index_face(self, collection_id, image, external_image_id, partition=None):
+        """
+        Add the face in the image to the collection. Returns the number of faces indexed.
+        """
+
+class RekognitionFaceMatcher(FaceMatcher):
+    """
+    Face matching with Amazon Rekognition collections.
+    Calls go through the shared rekognition governor (rate limit, retries and circuit breaker),
+    so the client should be built with max_attempts=1.
+    """
+
+    def __init__(self, client=None):
+        self.client = client or get_client('rekognition', max_attempts=1)
+
+    def search_faces(self, collection_id, image, similarity_threshold, max_faces):
+        response = governor.call(
+            'rekognition',
+            self.client.search_faces_by_image,
+            CollectionId=collection_id,
+            Image=image,
+            FaceMatchThreshold=similarity_threshold,
+            MaxFaces=max_faces
+        )
+        return response.get('FaceMatches', [])
+
+    def detect_faces(self, image):
+        response = governor.call('rekognition', self.client.detect_faces, Image=image, Attributes=['DEFAULT'])
+        return response.get('FaceDetails', [])
+
+    def create_collection(self, collection_id):
+        try:
+            governor.call('rekognition', self.client.create_collection, CollectionId=collection_id)
+            logger.info(f"Created collection {collection_id}.")
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceAlreadyExistsException':
+                raise
+
+    def index_face(self, collection_id, image, external_image_id, partition=None):
+        # Only the face vectors are used, so skip the extra attributes and low-quality faces
+        response = governor.call(
+            'rekognition',
+            self.client.index_faces,
+            CollectionId=collection_id,
+            Image=image,
+            ExternalImageId=external_image_id,
+            MaxFaces=INDEX_MAX_FACES,
+            QualityFilter=INDEX_QUALITY_FILTER,
+            DetectionAttributes=['DEFAULT']
+        )
+        return len(response.get('FaceRecords', []))
+
+def hash_embedding(image_bytes, dimension=FACE_EMBEDDING_DIM):
+    """
+    Deterministic unit vector derived from the image bytes.
+    Identical images match with 100% similarity and different images almost never match,
+    which is enough for offline load tests. Set FACE_EMBEDDER for real face embeddings.
+    """
+    seed = int.from_bytes(hashlib.sha256(image_bytes).digest()[:8], 'big')
+    vector = np.random.default_rng(seed).standard_normal(dimension).astype(np.float32)
+    return vector / np.linalg.norm(vector)
+
+def load_embedder(path):
+    """
+    Import an embedder (or shard router) given as "module:function".
+    """
+    module_name, function_name = path.split(':', 1)
+    return getattr(importlib.import_module(module_name), function_name)
+
+class NumpyFaceIndex:
+    """
+    Face embeddings for one collection, stored as a memory-mapped float32 matrix
+    with the ExternalImageId of each row kept alongside in JSON.
+    """
+
+    def __init__(self, directory, dimension, initial_capacity=FACE_INDEX_INITIAL_CAPACITY):
+        self.directory = directory
+        self.dimension = dimension
+        self.matrix_path = os.path.join(directory, 'embeddings.npy')
+        self.ids_path = os.path.join(directory, 'external_ids.json')
+        self.lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self.external_ids = []
+        if os.path.exists(self.ids_path):
+            with open(self.ids_path) as f:
+                self.external_ids = json.load(f)
+        if os.path.exists(self.matrix_path):
+            self.matrix = np.load(self.matrix_path, mmap_mode='r+')
+        else:
+            self.matrix = np.lib.format.open_memmap(
+                self.matrix_path, mode='w+', dtype=np.float32, shape=(initial_capacity, dimension)
+            )
+
+    @property
+    def count(self):
+        return len(self.external_ids)
+
+    def _grow(self):
+        """
+        Double the matrix capacity, copying the existing rows into a new memory-mapped file.
+        The new matrix replaces the old one in a single assignment, so a concurrent search sees
+        one or the other; the old mapping stays readable until it is released.
+        """
+        tmp_path = self.matrix_path + '.tmp'
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode='w+', dtype=np.float32, shape=(self.matrix.shape[0] * 2, self.dimension)
+        )
+        grown[:self.count] = self.matrix[:self.count]
+        grown.flush()
+        os.replace(tmp_path, self.matrix_path)  # The mapping follows the renamed file
+        self.matrix = grown
+
+    def add(self, embedding, external_image_id):
+        with self.lock:
+            if self.count >= self.matrix.shape[0]:
+                self._grow()
+            self.matrix[self.count] = embedding
+            self.matrix.flush()
+            self.external_ids.append(external_image_id)
+            tmp_path = self.ids_path + '.tmp'
+            with open(tmp_path, 'w') as f:
+                json.dump(self.external_ids, f)
+            os.replace(tmp_path, self.ids_path)
+
+    def search(self, embeddings, similarity_threshold, max_faces):
+        """
+        Vectorized cosine search of a (queries x dimension) matrix of unit vectors.
+        Returns a FaceMatches list per query, best match first.
+        The row count and matrix are read together under the lock; the product runs outside it.
+        """
+        with self.lock:
+            count = self.count
+            matrix = self.matrix
+        if count == 0:
+            return [[] for _ in range(len(embeddings))]
+        similarities = np.clip(embeddings @ matrix[:count].T, 0.0, 1.0) * 100.0
+        k = min(max_faces, count)
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in enumerate(top):
+            ordered = candidates[np.argsort(-similarities[row, candidates])]
+            results.append([
+                {
+                    'Similarity': float(similarities[row, column]),
+                    'Face': {'ExternalImageId': self.external_ids[column]}
+                }
+                for column in ordered
+                if similarities[row, column] >= similarity_threshold
+            ])
+        return results
+
+class NumpyFaceMatcher(FaceMatcher):
+    """
+    Local face matching against NumPy embedding indexes, one per collection id.
+    image_loader(bucket, key) fetches bytes for S3Object images.
+    """
+
+    def __init__(self, index_dir=FACE_INDEX_DIR, embedder=None, dimension=FACE_EMBEDDING_DIM, image_loader=None):
+        if np is None:
+            raise RuntimeError("NumPy is required for the numpy face matcher backend.")
+        self.index_dir = index_dir
+        self.dimension = dimension
+        self.embedder = embedder or (lambda image_bytes: hash_embedding(image_bytes, dimension))
+        self.image_loader = image_loader
+        self.indexes = {}
+        self.lock = threading.Lock()
+
+    def get_index(self, collection_id):
+        with self.lock:
+            if collection_id not in self.indexes:
+                self.indexes[collection_id] = NumpyFaceIndex(os.path.join(self.index_dir, collection_id), self.dimension)
+            return self.indexes[collection_id]
+
+    def get_image_bytes(self, image):
+        if 'Bytes' in image:
+            return image['Bytes']
+        if self.image_loader is None:
+            raise ValueError("An image_loader is required for S3Object images.")
+        s3_object = image['S3Object']
+        return self.image_loader(s3_object['Bucket'], s3_object['Name'])
+
+    def embed(self, image):
+        embedding = np.asarray(self.embedder(self.get_image_bytes(image)), dtype=np.float32)
+        return embedding / np.linalg.norm(embedding)
+
+    def search_faces(self, collection_id, image, similarity_threshold, max_faces):
+        return self.search_faces_batch(collection_id, [image], similarity_threshold, max_faces)[0]
+
+    def search_faces_batch(self, collection_id, images, similarity_threshold, max_faces):
+        embeddings = np.stack([self.embed(image) for image in images])
+        return self.get_index(collection_id).search(embeddings, similarity_threshold, max_faces)
+
+    def index_face(self, collection_id, image, external_image_id, partition=None):
+        self.get_index(collection_id).add(self.embed(image), external_image_id)
+        logger.info(f"Indexed face for {external_image_id} in local collection {collection_id}.")
+        return 1
+
+def hash_shard(external_image_id, shard_count, partition=None):
+    """
+    Stable shard index for an external image id (the same id always maps to the same shard).
+    The partition is not used; custom routers may place a partition's faces together.
+    """
+    return int.from_bytes(hashlib.sha256(external_image_id.encode('utf-8')).digest()[:8], 'big') % shard_count
+
+def get_shard_collections(collection_id, shard_count):
+    """
+    Collection ids of every shard. Shard 0 keeps the original id so an existing collection becomes the first shard.
+    """
+    return [collection_id] + [f"{collection_id}-{shard}" for shard in range(1, shard_count)]
+
+class ShardedFaceMatcher(FaceMatcher):
+    """
+    Spreads a logical collection over shard_count collections of the wrapped matcher.
+    Each face is indexed into the shard chosen by router(external_image_id, shard_count, partition)
+    (a stable hash of the id by default). Searches fan out to every shard in parallel and the
+    per-shard FaceMatches are merged into one top max_faces list by similarity.
+    A shard collection that does not exist yet is searched as empty and created on its first index.
+    """
+
+    def __init__(self, matcher, shard_count=FACE_COLLECTION_SHARDS, router=None, max_workers=FACE_SHARD_MAX_WORKERS):
+        self.matcher = matcher
+        self.shard_count = shard_count
+        self.router = router or hash_shard
+        self.executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, shard_count)))
+
+    def collection_for(self, collection_id, external_image_id, partition=None):
+        return get_shard_collections(collection_id, self.shard_count)[self.router(external_image_id, self.shard_count, partition)]
+
+    def detect_faces(self, image):
+        return self.matcher.detect_faces(image)
+
+    def search_faces(self, collection_id, image, similarity_threshold, max_faces):
+        return self.search_faces_batch(collection_id, [image], similarity_threshold, max_faces)[0]
+
+    def search_shard(self, shard_collection_id, images, similarity_threshold, max_faces):
+        try:
+            return self.matcher.search_faces_batch(shard_collection_id, images, similarity_threshold, max_faces)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+            logger.warning(f"Shard collection {shard_collection_id} does not exist yet; searching it as empty.")
+            return [[] for _ in images]
+
+    def search_faces_batch(self, collection_id, images, similarity_threshold, max_faces):
+        shard_results = list(self.executor.map(
+            lambda shard_collection_id: self.search_shard(shard_collection_id, images, similarity_threshold, max_faces),
+            get_shard_collections(collection_id, self.shard_count)
+        ))
+        merged = []
+        for position in range(len(images)):
+            face_matches = [match for results in shard_results for match in results[position]]
+            face_matches.sort(key=lambda match: match['Similarity'], reverse=True)
+            merged.append(face_matches[:max_faces])
+        return merged
+
+    def index_face(self, collection_id, image, external_image_id, partition=None):
+        shard_collection_id = self.collection_for(collection_id, external_image_id, partition)
+        try:
+            return self.matcher.index_face(shard_collection_id, image, external_image_id, partition)
+        except ClientError as e:
+            if e.response['Error']['Code'] != 'ResourceNotFoundException':
+                raise
+        self.matcher.create_collection(shard_collection_id)
+        return self.matcher.index_face(shard_collection_id, image, external_image_id, partition)
+
+def create_face_matcher(backend=FACE_MATCHER_BACKEND, rekognition_client=None, image_loader=None):
+    """
+    Build the face matcher selected by FACE_MATCHER_BACKEND, sharded when FACE_COLLECTION_SHARDS > 1.
+    """
+    if backend == "rekognition":
+        matcher = RekognitionFaceMatcher(rekognition_client)
+    elif backend == "numpy":
+        embedder = load_embedder(FACE_EMBEDDER) if FACE_EMBEDDER else None
+        matcher = NumpyFaceMatcher(embedder=embedder, image_loader=image_loader)
+    else:
+        raise ValueError(f"Unknown face matcher backend: {backend}")
+    if FACE_COLLECTION_SHARDS > 1:
+        router = load_embedder(FACE_SHARD_ROUTER) if FACE_SHARD_ROUTER else None
+        matcher = ShardedFaceMatcher(matcher, FACE_COLLECTION_SHARDS, router)
+    return matcher
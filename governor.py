@@ -0,0 +1,196 @@
+import os
+import random
+import threading
+import time
+import logging
+from botocore.exceptions import ClientError, ConnectionError, HTTPClientError
+import metrics
+
+# Initialize logging
+logger = logging.getLogger()
+logger.setLevel(logging.INFO)
+
+# Environment variables
+# Calls per second allowed from one Lambda container; set to the account quota divided by the function's concurrency
+REKOGNITION_MAX_TPS = float(os.environ.get("REKOGNITION_MAX_TPS", 50))
+SES_MAX_TPS = float(os.environ.get("SES_MAX_TPS", 14))
+GOVERNOR_MIN_TPS = float(os.environ.get("GOVERNOR_MIN_TPS", 0.5))  # Floor for the adaptive rate
+GOVERNOR_ADDITIVE_INCREASE = float(os.environ.get("GOVERNOR_ADDITIVE_INCREASE", 1.0))  # TPS regained per second without throttling
+GOVERNOR_DECREASE_FACTOR = float(os.environ.get("GOVERNOR_DECREASE_FACTOR", 0.5))  # Rate multiplier on each throttle
+GOVERNOR_MAX_ATTEMPTS = int(os.environ.get("GOVERNOR_MAX_ATTEMPTS", 4))  # Attempts per call, including the first
+GOVERNOR_BACKOFF_BASE = float(os.environ.get("GOVERNOR_BACKOFF_BASE", 0.1))  # Seconds, doubled per attempt
+GOVERNOR_BACKOFF_MAX = float(os.environ.get("GOVERNOR_BACKOFF_MAX", 5.0))  # Seconds
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", 5))  # Consecutive failed calls that open the circuit
+CIRCUIT_RESET_SECONDS = float(os.environ.get("CIRCUIT_RESET_SECONDS", 30))  # How long an open circuit rejects calls
+
+SERVICE_LIMITS = {
+    'rekognition': REKOGNITION_MAX_TPS,
+    'ses': SES_MAX_TPS,
+}
+
+THROTTLE_ERROR_CODES = {
+    'Throttling', 'ThrottlingException', 'ThrottledException', 'TooManyRequestsException',
+    'ProvisionedThroughputExceededException', 'RequestLimitExceeded', 'SlowDown',
+}
+SERVER_ERROR_CODES = {
+    'InternalError', 'InternalFailure', 'InternalServerError', 'ServiceUnavailable',
+    'ServiceUnavailableException',
+}
+
+governors = {}
+governors_lock = threading.Lock()
+
+class CircuitOpenError(Exception):
+    """
+    Raised instead of calling a service whose circuit is open.
+    """
+
+class TokenBucket:
+    """
+    Token bucket whose refill rate adapts with AIMD: additive increase while calls succeed,
+    multiplicative decrease when the service throttles.
+    """
+
+    def __init__(self, max_rate, min_rate=GOVERNOR_MIN_TPS):
+        self.max_rate = max_rate
+        self.min_rate = min(min_rate, max_rate)
+        self.rate = max_rate
+        self.tokens = max(1.0, max_rate)
+        self.updated = time.monotonic()
+        self.last_increase = self.updated
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(max(1.0, self.rate), self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """
+        Take one token, sleeping until one is available. Returns the seconds waited.
+        """
+        waited = 0.0
+        while True:
+            with self.lock:
+                self._refill(time.monotonic())
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return waited
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+            waited += wait
+
+    def on_success(self):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.last_increase >= 1.0:
+                self.rate = min(self.max_rate, self.rate + GOVERNOR_ADDITIVE_INCREASE)
+                self.last_increase = now
+
+    def on_throttle(self):
+        with self.lock:
+            self.rate = max(self.min_rate, self.rate * GOVERNOR_DECREASE_FACTOR)
+            self.tokens = min(self.tokens, 0.0)
+            self.last_increase = time.monotonic()
+
+class CircuitBreaker:
+    """
+    Opens after CIRCUIT_FAILURE_THRESHOLD consecutive failed calls and rejects calls for
+    CIRCUIT_RESET_SECONDS. After that, calls go through again and the first result decides
+    whether it closes or opens again.
+    """
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, reset_seconds=CIRCUIT_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            return self.opened_at is None or time.monotonic() - self.opened_at >= self.reset_seconds
+
+    def on_success(self):
+        with self.lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def on_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+
+class Governor:
+    """
+    Rate limiter, retry policy and circuit breaker for one service.
+    """
+
+    def __init__(self, service_name, max_rate):
+        self.service_name = service_name
+        self.bucket = TokenBucket(max_rate)
+        self.breaker = CircuitBreaker()
+
+    def call(self, operation, *args, **kwargs):
+        """
+        Call operation under the rate limit. Throttles and server or connection errors are retried
+        with jittered exponential backoff; other errors are raised right away.
+        """
+        if not self.breaker.allow():
+            raise CircuitOpenError(f"Circuit for {self.service_name} is open; failing fast.")
+        for attempt in range(GOVERNOR_MAX_ATTEMPTS):
+            waited = self.bucket.acquire()
+            if waited:
+                metrics.record(f"{self.service_name}_rate_wait", waited * 1000)
+            try:
+                result = operation(*args, **kwargs)
+            except Exception as e:
+                if not is_transient(e):
+                    # The service answered, so the circuit stays closed
+                    self.breaker.on_success()
+                    raise
+                if is_throttle(e):
+                    self.bucket.on_throttle()
+                    logger.warning(f"{self.service_name} throttled; rate lowered to {self.bucket.rate:.2f}/s.")
+                if attempt == GOVERNOR_MAX_ATTEMPTS - 1:
+                    self.breaker.on_failure()
+                    raise
+                time.sleep(random.uniform(0, min(GOVERNOR_BACKOFF_MAX, GOVERNOR_BACKOFF_BASE * (2 ** attempt))))
+                continue
+            self.bucket.on_success()
+            self.breaker.on_success()
+            return result
+
+def get_governor(service_name):
+    """
+    Return the shared governor for the service, limited by its *_MAX_TPS setting.
+    """
+    governor = governors.get(service_name)
+    if governor is None:
+        with governors_lock:
+            governor = governors.get(service_name)
+            if governor is None:
+                governor = governors[service_name] = Governor(service_name, SERVICE_LIMITS[service_name])
+    return governor
+
+def call(service_name, operation, *args, **kwargs):
+    """
+    Call operation(*args, **kwargs) through the service's governor.
+    """
+    return get_governor(service_name).call(operation, *args, **kwargs)
+
+def is_throttle(error):
+    return isinstance(error, ClientError) and error.response['Error'].get('Code') in THROTTLE_ERROR_CODES
+
+def is_transient(error):
+    """
+    Whether the error means "try again later" rather than a real answer.
+    Callers must fail the record on these instead of treating them as an empty result.
+    """
+    if isinstance(error, (CircuitOpenError, ConnectionError, HTTPClientError)):
+        return True
+    if isinstance(error, ClientError):
+        code = error.response['Error'].get('Code')
+        status = error.response.get('ResponseMetadata', {}).get('HTTPStatusCode', 0)
+        return code in THROTTLE_ERROR_CODES or code in SERVER_ERROR_CODES or status >= 500
+    return False
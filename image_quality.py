@@ -0,0 +1,105 @@
+import os
+import time
+from io import BytesIO
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Environment variables
+QUALITY_GATE_ENABLED = os.environ.get("QUALITY_GATE_ENABLED", "true").lower() == "true"
+QUALITY_SAMPLE_DIMENSION = int(os.environ.get("QUALITY_SAMPLE_DIMENSION", 256))  # Checks run on a grayscale copy at most this large
+QUALITY_MIN_DIMENSION = int(os.environ.get("QUALITY_MIN_DIMENSION", 80))  # Rekognition rejects images under 80 px per side
+QUALITY_MAX_ASPECT_RATIO = float(os.environ.get("QUALITY_MAX_ASPECT_RATIO", 4.0))  # Long side over short side
+QUALITY_MIN_SHARPNESS = float(os.environ.get("QUALITY_MIN_SHARPNESS", 20.0))  # Variance of the Laplacian of the sample
+QUALITY_MIN_BRIGHTNESS = float(os.environ.get("QUALITY_MIN_BRIGHTNESS", 25.0))  # Mean luminance, 0-255
+QUALITY_MAX_BRIGHTNESS = float(os.environ.get("QUALITY_MAX_BRIGHTNESS", 235.0))
+QUALITY_MIN_CONTRAST = float(os.environ.get("QUALITY_MIN_CONTRAST", 8.0))  # Luminance standard deviation; blank frames are near 0
+
+def is_available():
+    return QUALITY_GATE_ENABLED and np is not None and Image is not None
+
+def check_resolution(size, bound_dimension=None):
+    """
+    Reject images too small to search. When the image is a variant limited to bound_dimension and
+    reaches that limit, it may have been downscaled, so its size is only a lower bound and passes.
+    """
+    if bound_dimension and max(size) >= bound_dimension:
+        return None
+    if min(size) < QUALITY_MIN_DIMENSION:
+        return f"too_small: {size[0]}x{size[1]} is under {QUALITY_MIN_DIMENSION} px"
+    return None
+
+def check_aspect_ratio(size):
+    ratio = max(size) / max(1, min(size))
+    if ratio > QUALITY_MAX_ASPECT_RATIO:
+        return f"aspect_ratio: {ratio:.1f} exceeds {QUALITY_MAX_ASPECT_RATIO:.1f}"
+    return None
+
+def check_exposure(sample):
+    brightness = float(sample.mean())
+    if brightness < QUALITY_MIN_BRIGHTNESS:
+        return f"too_dark: mean luminance {brightness:.0f} is under {QUALITY_MIN_BRIGHTNESS:.0f}"
+    if brightness > QUALITY_MAX_BRIGHTNESS:
+        return f"too_bright: mean luminance {brightness:.0f} is over {QUALITY_MAX_BRIGHTNESS:.0f}"
+    contrast = float(sample.std())
+    if contrast < QUALITY_MIN_CONTRAST:
+        return f"low_contrast: luminance deviation {contrast:.1f} is under {QUALITY_MIN_CONTRAST:.1f}"
+    return None
+
+def check_sharpness(sample):
+    """
+    Reject blurry images by the variance of the 4-neighbour Laplacian, computed with array slices.
+    """
+    laplacian = (
+        sample[:-2, 1:-1] + sample[2:, 1:-1] + sample[1:-1, :-2] + sample[1:-1, 2:]
+        - 4 * sample[1:-1, 1:-1]
+    )
+    sharpness = float(laplacian.var()) if laplacian.size else 0.0
+    if sharpness < QUALITY_MIN_SHARPNESS:
+        return f"blurry: sharpness {sharpness:.1f} is under {QUALITY_MIN_SHARPNESS:.1f}"
+    return None
+
+def load_sample(image):
+    """
+    Decode a grayscale copy of an opened Pillow image at most QUALITY_SAMPLE_DIMENSION large.
+    JPEGs are decoded at a reduced DCT scale, so large photos are never decoded at full size.
+    """
+    image.draft('L', (QUALITY_SAMPLE_DIMENSION, QUALITY_SAMPLE_DIMENSION))
+    sample = image.convert('L')
+    sample.thumbnail((QUALITY_SAMPLE_DIMENSION, QUALITY_SAMPLE_DIMENSION), Image.BILINEAR)
+    return np.asarray(sample, dtype=np.float32)
+
+def check_image(image_bytes, bound_dimension=None):
+    """
+    Run the quality checks on encoded image bytes, cheapest first, stopping at the first failure.
+    bound_dimension is the size limit of the variant passed in, if it is one (see check_resolution).
+    Returns (rejection reason or None, {check: milliseconds}).
+    """
+    timings = {}
+    start = time.perf_counter()
+    with Image.open(BytesIO(image_bytes)) as image:
+        size = image.size  # Read from the header, before any decoding
+        timings["header"] = (time.perf_counter() - start) * 1000
+        start = time.perf_counter()
+        for name, check in (("resolution", lambda: check_resolution(size, bound_dimension)),
+                            ("aspect_ratio", lambda: check_aspect_ratio(size))):
+            reason = check()
+            timings[name] = (time.perf_counter() - start) * 1000
+            start = time.perf_counter()
+            if reason:
+                return reason, timings
+        sample = load_sample(image)
+    timings["decode"] = (time.perf_counter() - start) * 1000
+    for name, check in (("exposure", check_exposure), ("sharpness", check_sharpness)):
+        start = time.perf_counter()
+        reason = check(sample)
+        timings[name] = (time.perf_counter() - start) * 1000
+        if reason:
+            return reason, timings
+    return None, timings
@@ -0,0 +1,58 @@
+import os
+from io import BytesIO
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Environment variables
+IMAGE_VARIANTS_ENABLED = os.environ.get("IMAGE_VARIANTS_ENABLED", "true").lower() == "true"
+VARIANT_CACHE_CONTROL = os.environ.get("VARIANT_CACHE_CONTROL", "public, max-age=31536000, immutable")  # Content-addressed keys never change
+
+# Derivatives written next to every uploaded image, as <key without extension>.<variant>.jpg
+VARIANTS = {
+    "thumb": {  # UI lists
+        "max_dimension": int(os.environ.get("THUMBNAIL_MAX_DIMENSION", 256)),
+        "quality": 80
+    },
+    "medium": {  # Detail views and notification emails
+        "max_dimension": int(os.environ.get("MEDIUM_MAX_DIMENSION", 1024)),
+        "quality": 85
+    },
+    "rekognition": {  # Face search and indexing: large enough for small faces, far below the 15 MB S3Object limit
+        "max_dimension": int(os.environ.get("REKOGNITION_MAX_DIMENSION", 1600)),
+        "quality": 90
+    },
+}
+
+def variant_key(key, variant):
+    """
+    Return the S3 key of a variant of the image stored under key.
+    """
+    stem, _, extension = key.rpartition('.')
+    if not stem or '/' in extension:
+        stem = key
+    return f"{stem}.{variant}.jpg"
+
+def render_variants(image, source_jpeg=None):
+    """
+    Render every variant of a decoded RGB Pillow image as JPEG bytes.
+    Variants are rendered largest first, each downscaled from the previous one, so the
+    full-size image is only resampled once. A variant the image already fits reuses the
+    bytes of the next larger one (starting from source_jpeg, the stored JPEG) instead of
+    being re-encoded, so no variant is larger than what it was made from.
+    Returns {variant: jpeg bytes}.
+    """
+    rendered = {}
+    previous = source_jpeg
+    working = image.copy()
+    for variant, spec in sorted(VARIANTS.items(), key=lambda item: item[1]["max_dimension"], reverse=True):
+        if previous is not None and max(working.size) <= spec["max_dimension"]:
+            rendered[variant] = previous
+            continue
+        working.thumbnail((spec["max_dimension"], spec["max_dimension"]), Image.LANCZOS)
+        output = BytesIO()
+        working.save(output, format="JPEG", quality=spec["quality"], optimize=True)
+        rendered[variant] = previous = output.getvalue()
+    return rendered
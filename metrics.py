@@ -0,0 +1,125 @@
+import json
+import os
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+# Environment variables
+METRICS_NAMESPACE = os.environ.get("METRICS_NAMESPACE", "SGFind")
+METRICS_SAMPLE_RATE = float(os.environ.get("METRICS_SAMPLE_RATE", 1.0))  # Share of invocations that emit metrics
+EVENT_LOG_SAMPLE_RATE = float(os.environ.get("EVENT_LOG_SAMPLE_RATE", 1.0))  # Share of invocations that log the redacted event
+EMF_MAX_VALUES = 100  # CloudWatch EMF limit on values per metric
+
+# Per-invocation state. Lambda runs one invocation per container at a time,
+# but record workers inside an invocation record stages concurrently.
+recorder_lock = threading.Lock()
+stage_samples = {}
+function_name = ""
+sampled = True
+
+class StageTimer:
+    """
+    Handle yielded by stage() so callers can attach the number of bytes a stage handled.
+    """
+
+    def __init__(self):
+        self.size = None
+
+def start_invocation(name):
+    """
+    Reset the recorded stages and decide whether this invocation is sampled.
+    """
+    global function_name, sampled
+    with recorder_lock:
+        stage_samples.clear()
+        function_name = name
+        sampled = random.random() < METRICS_SAMPLE_RATE
+
+def record(stage_name, duration_ms, size=None):
+    """
+    Record one timing (and optional byte count) for a stage.
+    """
+    with recorder_lock:
+        samples = stage_samples.setdefault(stage_name, {'durations': [], 'sizes': []})
+        samples['durations'].append(round(duration_ms, 3))
+        if size is not None:
+            samples['sizes'].append(size)
+
+@contextmanager
+def stage(stage_name, size=None):
+    """
+    Time the enclosed block as one call of the named stage.
+    """
+    timer = StageTimer()
+    timer.size = size
+    start = time.perf_counter()
+    try:
+        yield timer
+    finally:
+        record(stage_name, (time.perf_counter() - start) * 1000, timer.size)
+
+def build_emf(stage_name, samples, timestamp):
+    """
+    Build one CloudWatch Embedded Metric Format document for a stage.
+    """
+    metric_definitions = [
+        {'Name': 'Duration', 'Unit': 'Milliseconds'},
+        {'Name': 'Calls', 'Unit': 'Count'}
+    ]
+    document = {
+        '_aws': {
+            'Timestamp': timestamp,
+            'CloudWatchMetrics': [{
+                'Namespace': METRICS_NAMESPACE,
+                'Dimensions': [['Function', 'Stage']],
+                'Metrics': metric_definitions
+            }]
+        },
+        'Function': function_name,
+        'Stage': stage_name,
+        'Duration': samples['durations'][:EMF_MAX_VALUES],
+        'Calls': len(samples['durations'])
+    }
+    if samples['sizes']:
+        metric_definitions.append({'Name': 'Bytes', 'Unit': 'Bytes'})
+        document['Bytes'] = samples['sizes'][:EMF_MAX_VALUES]
+    return document
+
+def flush():
+    """
+    Print the recorded stages as EMF JSON lines (picked up by CloudWatch Logs) and reset them.
+    """
+    with recorder_lock:
+        pending = dict(stage_samples)
+        stage_samples.clear()
+    if not sampled or not pending:
+        return
+    timestamp = int(time.time() * 1000)
+    for stage_name, samples in pending.items():
+        print(json.dumps(build_emf(stage_name, samples, timestamp)))
+
+def should_log_event():
+    """
+    Decide whether to log the (redacted) incoming event for this invocation.
+    """
+    return random.random() < EVENT_LOG_SAMPLE_RATE
+
+def redact_event(event):
+    """
+    Return a copy of an API Gateway or SQS event that is safe and cheap to log.
+    Bodies are replaced by their length.
+    """
+    redacted = {key: value for key, value in event.items() if key not in ('body', 'Records', 'multiValueHeaders')}
+    if 'body' in event:
+        redacted['body'] = f"<redacted {len(event.get('body') or '')} chars>"
+    if 'Records' in event:
+        redacted['Records'] = [
+            {
+                'messageId': record.get('messageId'),
+                'eventSource': record.get('eventSource'),
+                'body': f"<redacted {len(record.get('body') or '')} chars>"
+            }
+            for record in event['Records']
+        ]
+    return redacted
@@ -0,0 +1,219 @@
+"""
+Re-run face matching over the whole family table.
+
+Use after changing SIMILARITY_THRESHOLD, rebuilding the Rekognition collection or recovering
+from an outage. The table is read with parallel segmented Scans and every row with an
+image_url is run through the processor's process_record on a worker pool, at most --rate
+rows per second (Rekognition and SES calls are additionally limited by governor.py).
+Progress is checkpointed after every Scan page, so an interrupted run resumes where it
+stopped when started again with the same --checkpoint.
+
+    python tools/backfill.py --dry-run            # search only: no indexing, no writes, no email
+    python tools/backfill.py --no-email           # index and update rows, but send no notifications
+    python tools/backfill.py --segments 16 --workers 16 --rate 40
+
+The processor settings (DYNAMODB_TABLE_NAME, REKOGNITION_COLLECTION_ID, SIMILARITY_THRESHOLD,
+SES_SENDER_EMAIL, ...) are read from the environment. The idempotency ledger and the DynamoDB
+face search cache are bypassed so every row is searched again with the current settings.
+"""
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+# Re-run every row: no ledger, no cached search results, notifications queued rather than sent inline
+os.environ["IDEMPOTENCY_TABLE"] = ""
+os.environ["FACE_SEARCH_CACHE_TABLE"] = ""
+os.environ["NOTIFICATION_MODE"] = "digest"
+os.environ.setdefault("EVENT_LOG_SAMPLE_RATE", "0")
+
+from aws_clients import get_resource
+from governor import TokenBucket
+
+SCAN_PROJECTION = ["owner_id", "family_member_id", "family_member_name", "image_url", "image_variants"]
+
+def load_processor():
+    spec = importlib.util.spec_from_file_location("processor", os.path.join(REPO_ROOT, "ProcessImagetoRekongition&SES.py"))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+class Checkpoint:
+    """
+    Per-segment scan positions and counters, saved atomically to a JSON file.
+    """
+
+    def __init__(self, path, total_segments, restart=False):
+        self.path = path
+        self.lock = threading.Lock()
+        self.state = None
+        if os.path.exists(path) and not restart:
+            with open(path) as f:
+                self.state = json.load(f)
+            if self.state["total_segments"] != total_segments:
+                raise SystemExit(
+                    f"{path} was written with --segments {self.state['total_segments']}; "
+                    f"use the same value or --restart."
+                )
+        if self.state is None:
+            self.state = {
+                "total_segments": total_segments,
+                "segments": {str(segment): {"last_key": None, "done": False} for segment in range(total_segments)},
+                "counts": {"processed": 0, "failed": 0, "skipped": 0, "matched": 0, "notifications": 0},
+                "failed_rows": []
+            }
+
+    def segment(self, segment):
+        return self.state["segments"][str(segment)]
+
+    def update(self, segment, last_key, counts, failed_rows):
+        with self.lock:
+            self.state["segments"][str(segment)] = {"last_key": last_key, "done": last_key is None}
+            for name, value in counts.items():
+                self.state["counts"][name] += value
+            self.state["failed_rows"].extend(failed_rows)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(self.state, f)
+            os.replace(tmp_path, self.path)
+
+def build_record(item):
+    """
+    Turn a family row into the SQS record process_record expects.
+    """
+    body = {
+        "owner_id": item["owner_id"],
+        "family_member_id": item["family_member_id"],
+        "family_member_name": item.get("family_member_name", ""),
+        "image_url": item["image_url"],
+        "purpose": "process_family_member_status"
+    }
+    if item.get("image_variants"):
+        body["image_variants"] = item["image_variants"]
+    return {"messageId": f"backfill-{item['family_member_id']}", "body": json.dumps(body, default=str)}
+
+def process_row(processor, item, dry_run):
+    """
+    Process one row. Returns (matched, notifications).
+    A dry run only searches the collection and reports whether the row matched another member;
+    registered rows that are already indexed also find their own face, which is not a match.
+    """
+    if dry_run:
+        bucket, key = processor.parse_s3_url(item["image_url"])
+        variants = item.get("image_variants") or {}
+        search_bucket, search_key = processor.get_variant_location(variants, "rekognition", bucket, key)
+        matches = processor.search_faces_cached(
+            processor.S3Image(search_bucket, search_key),
+            processor.REKOGNITION_COLLECTION_ID,
+            processor.SIMILARITY_THRESHOLD
+        )
+        other_matches, _ = processor.split_own_match(matches, item["family_member_id"])
+        return bool(other_matches), []
+    record = build_record(item)
+    notifications = processor.process_record(record) or []
+    for notification in notifications:
+        notification["message_id"] = record["messageId"]
+    return None, notifications
+
+def run_segment(processor, table_name, segment, args, checkpoint, row_executor, bucket):
+    """
+    Scan one segment page by page, process each page on the shared worker pool,
+    send its notifications and checkpoint the page.
+    """
+    position = checkpoint.segment(segment)
+    if position["done"]:
+        return
+    table = get_resource("dynamodb").Table(table_name)
+    scan_kwargs = {
+        "Segment": segment,
+        "TotalSegments": args.segments,
+        "Limit": args.page_size,
+        "ProjectionExpression": ", ".join(f"#f{index}" for index in range(len(SCAN_PROJECTION))),
+        "ExpressionAttributeNames": {f"#f{index}": field for index, field in enumerate(SCAN_PROJECTION)}
+    }
+    last_key = position["last_key"]
+    while True:
+        if last_key:
+            scan_kwargs["ExclusiveStartKey"] = last_key
+        page = table.scan(**scan_kwargs)
+        items = [item for item in page.get("Items", []) if item.get("image_url")]
+        counts = {"processed": 0, "failed": 0, "skipped": len(page.get("Items", [])) - len(items), "matched": 0, "notifications": 0}
+        failed_rows = []
+
+        def run_row(item):
+            bucket.acquire()
+            try:
+                return item, process_row(processor, item, args.dry_run), None
+            except Exception as e:
+                return item, None, str(e)
+
+        notifications = []
+        for item, result, error in row_executor.map(run_row, items):
+            if error:
+                counts["failed"] += 1
+                failed_rows.append({"owner_id": item["owner_id"], "family_member_id": item["family_member_id"], "error": error})
+                continue
+            counts["processed"] += 1
+            matched, queued = result
+            counts["matched"] += 1 if matched else 0
+            notifications.extend(queued)
+
+        if notifications and not args.no_email:
+            failed_ids = processor.send_notification_digests(notifications)
+            counts["failed"] += len(failed_ids)
+            failed_rows.extend({"message_id": message_id, "error": "notification not sent"} for message_id in failed_ids)
+        counts["notifications"] = len(notifications)
+
+        last_key = page.get("LastEvaluatedKey")
+        checkpoint.update(segment, last_key, counts, failed_rows)
+        print(f"segment {segment}: {counts['processed']} processed, {counts['failed']} failed", file=sys.stderr)
+        if not last_key:
+            return
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--table", default=os.environ.get("DYNAMODB_TABLE_NAME", ""), help="Family table to scan")
+    parser.add_argument("--segments", type=int, default=8, help="Parallel Scan segments")
+    parser.add_argument("--workers", type=int, default=8, help="Rows processed concurrently")
+    parser.add_argument("--rate", type=float, default=20, help="Rows started per second")
+    parser.add_argument("--page-size", type=int, default=100, help="Rows per Scan page (the checkpoint granularity)")
+    parser.add_argument("--checkpoint", default="backfill-checkpoint.json", help="Progress file used to resume")
+    parser.add_argument("--restart", action="store_true", help="Ignore an existing checkpoint")
+    parser.add_argument("--dry-run", action="store_true", help="Only search; no indexing, table updates or email")
+    parser.add_argument("--no-email", action="store_true", help="Process rows but send no notifications")
+    args = parser.parse_args()
+    if not args.table:
+        parser.error("--table (or DYNAMODB_TABLE_NAME) is required")
+    os.environ["DYNAMODB_TABLE_NAME"] = args.table
+
+    processor = load_processor()
+    logging.getLogger().setLevel(logging.WARNING)  # The processor logs every record at INFO
+
+    checkpoint = Checkpoint(args.checkpoint, args.segments, args.restart)
+    bucket = TokenBucket(args.rate)
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.workers) as row_executor, \
+            ThreadPoolExecutor(max_workers=args.segments) as segment_executor:
+        futures = [
+            segment_executor.submit(run_segment, processor, args.table, segment, args, checkpoint, row_executor, bucket)
+            for segment in range(args.segments)
+        ]
+        for future in futures:
+            future.result()
+
+    summary = dict(checkpoint.state["counts"])
+    summary["elapsed_seconds"] = round(time.perf_counter() - start, 1)
+    summary["dry_run"] = args.dry_run
+    summary["failed_rows"] = checkpoint.state["failed_rows"][:100]
+    print(json.dumps(summary, indent=2, default=str))
+
+if __name__ == "__main__":
+    main()
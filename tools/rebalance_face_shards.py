@@ -0,0 +1,162 @@
+"""
+Move indexed faces to the shard collections the router assigns them to.
+
+Run after changing FACE_COLLECTION_SHARDS (or FACE_SHARD_ROUTER). Every shard collection of
+the old and new layout is listed, and each face whose ExternalImageId (family_member_id) now
+routes to another shard is re-indexed there from the member's image_url and deleted from its
+old shard. The family item's face_collection attribute is updated to match. Rekognition cannot
+copy face vectors, so a moved member ends up with one face indexed from its current image.
+
+    python tools/rebalance_face_shards.py --collection-id faces --from-shards 1 --shards 4 --dry-run
+    python tools/rebalance_face_shards.py --collection-id faces --from-shards 1 --shards 4
+
+When lowering the shard count, rebalance before deploying the new count: the processor only
+searches the shards of its current layout.
+"""
+import argparse
+import json
+import os
+import sys
+import urllib.parse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from botocore.exceptions import ClientError
+from boto3.dynamodb.conditions import Key
+from aws_clients import get_client, get_resource
+import governor
+from face_matchers import FACE_SHARD_ROUTER, INDEX_QUALITY_FILTER, get_shard_collections, hash_shard, load_embedder
+
+LIST_FACES_PAGE_SIZE = 4096  # Rekognition ListFaces / DeleteFaces limit
+
+def list_faces(collection_id):
+    """
+    Yield every face in the collection. A collection that does not exist yields nothing.
+    """
+    rekognition = get_client('rekognition', max_attempts=1)
+    kwargs = {'CollectionId': collection_id, 'MaxResults': LIST_FACES_PAGE_SIZE}
+    while True:
+        try:
+            response = governor.call('rekognition', rekognition.list_faces, **kwargs)
+        except ClientError as e:
+            if e.response['Error']['Code'] == 'ResourceNotFoundException':
+                return
+            raise
+        yield from response.get('Faces', [])
+        if not response.get('NextToken'):
+            return
+        kwargs['NextToken'] = response['NextToken']
+
+def ensure_collection(collection_id):
+    try:
+        governor.call('rekognition', get_client('rekognition', max_attempts=1).create_collection, CollectionId=collection_id)
+        print(f"Created collection {collection_id}", file=sys.stderr)
+    except ClientError as e:
+        if e.response['Error']['Code'] != 'ResourceAlreadyExistsException':
+            raise
+
+def load_owner_ids(table):
+    """
+    Map every family_member_id to its owner_id, the partition a custom FACE_SHARD_ROUTER may route by.
+    """
+    owner_ids = {}
+    kwargs = {'ProjectionExpression': "owner_id, family_member_id"}
+    while True:
+        response = table.scan(**kwargs)
+        owner_ids.update((item['family_member_id'], item['owner_id']) for item in response.get('Items', []))
+        if not response.get('LastEvaluatedKey'):
+            return owner_ids
+        kwargs['ExclusiveStartKey'] = response['LastEvaluatedKey']
+
+def find_family_member(table, family_member_id):
+    """
+    Return the family item for a family_member_id, or None.
+    """
+    response = table.query(
+        IndexName='family_member_id-index',
+        KeyConditionExpression=Key('family_member_id').eq(family_member_id)
+    )
+    items = response.get('Items', [])
+    return items[0] if items else None
+
+def move_member(table, family_member_id, source_collection_id, target_collection_id, face_ids):
+    """
+    Index the member's image into the target shard, then delete its faces from the source shard.
+    """
+    item = find_family_member(table, family_member_id)
+    if not item or not item.get('image_url'):
+        raise ValueError("family item or image_url not found")
+    parsed_url = urllib.parse.urlparse(item['image_url'])
+    image = {'S3Object': {
+        'Bucket': parsed_url.netloc.split('.')[0],
+        'Name': urllib.parse.unquote(parsed_url.path.lstrip('/'))
+    }}
+    rekognition = get_client('rekognition', max_attempts=1)
+    response = governor.call(
+        'rekognition',
+        rekognition.index_faces,
+        CollectionId=target_collection_id,
+        Image=image,
+        ExternalImageId=family_member_id,
+        MaxFaces=1,
+        QualityFilter=INDEX_QUALITY_FILTER,
+        DetectionAttributes=['DEFAULT']
+    )
+    if not response.get('FaceRecords'):
+        raise ValueError("no face indexed from image_url")
+    governor.call('rekognition', rekognition.delete_faces, CollectionId=source_collection_id, FaceIds=face_ids)
+    table.update_item(
+        Key={'owner_id': item['owner_id'], 'family_member_id': family_member_id},
+        UpdateExpression="SET face_collection = :face_collection",
+        ExpressionAttributeValues={':face_collection': target_collection_id}
+    )
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--collection-id", default=os.environ.get("REKOGNITION_COLLECTION_ID", ""), help="Logical collection id (shard 0)")
+    parser.add_argument("--from-shards", type=int, required=True, help="Shard count the faces were indexed with")
+    parser.add_argument("--shards", type=int, required=True, help="New shard count")
+    parser.add_argument("--table", default=os.environ.get("DYNAMODB_TABLE_NAME", ""), help="Family table with image_url per member")
+    parser.add_argument("--dry-run", action="store_true", help="Only report the planned moves")
+    args = parser.parse_args()
+    if not args.collection_id or not args.table:
+        parser.error("--collection-id and --table (or REKOGNITION_COLLECTION_ID and DYNAMODB_TABLE_NAME) are required")
+
+    router = load_embedder(FACE_SHARD_ROUTER) if FACE_SHARD_ROUTER else hash_shard
+    target_collections = get_shard_collections(args.collection_id, args.shards)
+    source_collections = get_shard_collections(args.collection_id, max(args.from_shards, args.shards))
+    table = get_resource('dynamodb').Table(args.table)
+    owner_ids = load_owner_ids(table) if FACE_SHARD_ROUTER else {}  # The default router only hashes the id
+    if not args.dry_run:
+        for collection_id in target_collections:
+            ensure_collection(collection_id)
+
+    summary = {"scanned": 0, "members_to_move": 0, "moved": 0, "failed": {}, "moves": {}}
+    for source_collection_id in source_collections:
+        # Group face ids per member so each member is re-indexed once
+        misplaced = {}
+        for face in list_faces(source_collection_id):
+            summary["scanned"] += 1
+            family_member_id = face.get('ExternalImageId')
+            if not family_member_id:
+                continue
+            target_collection_id = target_collections[router(family_member_id, args.shards, owner_ids.get(family_member_id))]
+            if target_collection_id != source_collection_id:
+                misplaced.setdefault((family_member_id, target_collection_id), []).append(face['FaceId'])
+
+        for (family_member_id, target_collection_id), face_ids in misplaced.items():
+            move = f"{source_collection_id} -> {target_collection_id}"
+            summary["moves"][move] = summary["moves"].get(move, 0) + 1
+            summary["members_to_move"] += 1
+            if args.dry_run:
+                continue
+            try:
+                move_member(table, family_member_id, source_collection_id, target_collection_id, face_ids)
+                summary["moved"] += 1
+            except Exception as e:
+                summary["failed"][family_member_id] = str(e)
+                print(f"Could not move {family_member_id}: {e}", file=sys.stderr)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()